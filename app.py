@@ -1,24 +1,63 @@
 import os
-import requests
 import certifi
 import uuid
-import tempfile
 import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
 from datetime import datetime, timezone
 from datetime import timedelta
+import click
 import fitz  # PyMuPDF
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import base64
 from auth.routes import auth_bp, init_auth_routes
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 from dotenv import load_dotenv
 import cloudinary
 import cloudinary.uploader
 from google import genai
-from pdf_pipeline.parser import PDFParser
+from pdf_pipeline.parser import PDFParser, blip_status, caption_batcher, ocr_pool, warmup_blip
+from pdf_pipeline.blob_cache import PDFBlobCache
+from pdf_pipeline.doc_pool import DocumentPool
+from pdf_pipeline.inference_cache import make_inference_cache
+from pdf_pipeline.http_client import HTTPFetcher
+from pdf_pipeline.jobs import ParseJobRunner
+from pdf_pipeline.llm_cache import make_llm_cache
+from pdf_pipeline.map_reduce import (
+    MapReducer,
+    allocate,
+    chunk_pages,
+    merge_quiz,
+    merge_revision_packs,
+    page_block,
+)
+from pdf_pipeline.prefetch import PagePrefetcher
+from pdf_pipeline.single_flight import SingleFlight, SingleFlightTimeout
+from pdf_pipeline.worker_pool import PoolBusy, PoolTaskTimeout, make_parser_pool
+from pdf_pipeline.render import (
+    IMAGE_MIMETYPES,
+    MAX_TILE_ZOOM,
+    THUMBNAIL_SCALE,
+    clamp_scale,
+    make_render_cache,
+    render_cache_key,
+    render_page,
+    render_thumbnails,
+    render_tile,
+    thumbnail_cache_key,
+    tile_cache_key,
+)
+from pdf_pipeline.metadata import (
+    METADATA_VERSION,
+    METADATA_FIELDS,
+    extract_pdf_metadata_from_path,
+    page_count_from_linearized_head,
+)
 from flask_bcrypt import Bcrypt
 
 from flask_jwt_extended import JWTManager
@@ -36,6 +75,12 @@ from flask_jwt_extended import (
 load_dotenv()
 app = Flask(__name__)
 
+# Started as `python app.py` with PARSER_PROCESSES set, the parser pool's
+# (spawned) children run this file again as __mp_main__. They only need
+# pdf_pipeline, so below, nothing connects to Mongo or starts threads,
+# parse jobs or another pool in them.
+IN_PARSER_CHILD = __name__ == "__mp_main__"
+
 # CORS FIX: Proper configuration for credentials
 CORS(
     app,
@@ -63,10 +108,25 @@ client = MongoClient(
     tls=True,
     connectTimeoutMS=30000,
     socketTimeoutMS=30000,
-    retryWrites=True
+    retryWrites=True,
+    connect=not IN_PARSER_CHILD,
 )
 db = client["study"]
 
+def _ensure_indexes():
+    try:
+        db.pdfs.create_index("contentHash")
+        db.parsed_pages.create_index(
+            [("contentHash", 1), ("pageNumber", 1)], unique=True
+        )
+        db.parse_jobs.create_index([("pdfId", 1), ("createdAt", -1)])
+        db.parse_jobs.create_index("status")
+    except Exception as e:
+        print(f"Index creation failed: {e}")
+
+if not IN_PARSER_CHILD:
+    _ensure_indexes()
+
 # Initialize and register auth routes (pass bcrypt & jwt)
 init_auth_routes(db, bcrypt, jwt)
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -80,7 +140,30 @@ def handle_preflight():
 # --------------------------------------------------
 # PDF Parser
 # --------------------------------------------------
-pdf_parser = PDFParser()
+# OCR text / captions of repeated images, keyed by image content hash
+inference_cache = make_inference_cache()
+pdf_parser = PDFParser(inference_cache=inference_cache)
+
+# Optional process pool for parser CPU work (PARSER_PROCESSES > 0)
+parser_pool = None if IN_PARSER_CHILD else make_parser_pool()
+
+# Pooled keep-alive HTTP client for Cloudinary fetches
+http_fetcher = HTTPFetcher()
+
+# Local PDF blob cache (only the first request for a PDF hits Cloudinary)
+pdf_cache = PDFBlobCache()
+
+# Open fitz.Document handles shared by parsing and rendering
+doc_pool = DocumentPool()
+
+# Rendered page images, keyed by (pdf hash, page, scale, format)
+render_cache = make_render_cache()
+
+# Background work (thumbnail strips after upload)
+background_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BACKGROUND_WORKERS", "2")),
+    thread_name_prefix="studymate-bg",
+)
 
 # --------------------------------------------------
 # Cloudinary Config
@@ -97,6 +180,12 @@ cloudinary.config(
 gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 GEMINI_MODEL = "gemini-2.5-flash"
 
+# Page explanations already generated for the same text (any upload/edition)
+llm_cache = None if IN_PARSER_CHILD else make_llm_cache(db.llm_cache)
+
+# Per-chunk quiz / revision pack calls for large page selections
+map_reducer = MapReducer()
+
 # --------------------------------------------------
 # Helpers
 # --------------------------------------------------
@@ -148,6 +237,43 @@ def _get_optional_user_id():
     except Exception:
         return None
 
+def _download_pdf(url, dest_path):
+    http_fetcher.download(url, dest_path)
+
+def _get_local_pdf_path(pdf_entry):
+    pdf_path = pdf_cache.get_path(
+        pdf_entry["_id"],
+        pdf_entry["pdfUrl"],
+        _download_pdf,
+        content_hash=pdf_entry.get("contentHash"),
+    )
+    # Older uploads have no contentHash yet: record it now that we know it,
+    # so they start sharing parsed pages too
+    if not pdf_entry.get("contentHash"):
+        pdf_entry["contentHash"] = pdf_cache.content_hash_of(pdf_path)
+        db.pdfs.update_one(
+            {"_id": pdf_entry["_id"]},
+            {"$set": {"contentHash": pdf_entry["contentHash"]}},
+        )
+    return pdf_path
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _borrow_pdf(pdf_entry):
+    """Context manager yielding an open fitz.Document for this PDF."""
+    key = pdf_entry.get("contentHash") or str(pdf_entry["_id"])
+    return doc_pool.borrow(key, lambda: _read_file(_get_local_pdf_path(pdf_entry)))
+
+def _backfill_pdf_metadata(pdf_entry):
+    pdf_meta = extract_pdf_metadata_from_path(_get_local_pdf_path(pdf_entry))
+    db.pdfs.update_one({"_id": pdf_entry["_id"]}, {"$set": pdf_meta})
+    # Later uploads of the same file copy their metadata from the blob record
+    if pdf_entry.get("contentHash"):
+        db.blobs.update_one({"_id": pdf_entry["contentHash"]}, {"$set": pdf_meta})
+    return pdf_meta
+
 def _serialize_conversation(doc):
     if not doc:
         return None
@@ -166,6 +292,9 @@ def _serialize_conversation(doc):
 # --------------------------------------------------
 # Prompt Builder
 # --------------------------------------------------
+# Part of the explanation cache key: bump whenever build_student_prompt changes
+STUDENT_PROMPT_VERSION = "1"
+
 def build_student_prompt(page_text, language):
     return f"""
 TASK:
@@ -188,6 +317,287 @@ CONTENT:
 {page_text}
 """
 
+# --------------------------------------------------
+# Page parsing (shared by routes)
+# --------------------------------------------------
+def _language_key(language):
+    return re.sub(r"[^a-z0-9_-]", "", (language or "english").lower()) or "english"
+
+def _find_own_page(pdf_entry, page_no):
+    return next(
+        (p for p in pdf_entry.get("pages", []) if p["pageNumber"] == page_no),
+        None,
+    )
+
+NO_EXPLANATION = "Unable to generate explanation."
+
+def _store_page(pdf_entry, page_no, page_text, explanation, language, image_triage=None, layout=None):
+    # Idempotent: only pushed while the PDF has no entry for this page yet
+    # (first writer wins if two workers race on it)
+    db.pdfs.update_one(
+        {"_id": pdf_entry["_id"], "pages.pageNumber": {"$ne": page_no}},
+        {
+            "$push": {
+                "pages": {
+                    "pageNumber": page_no,
+                    "text": page_text,
+                    "explanation": explanation,
+                    "language": language,
+                    "imageTriage": image_triage or {},
+                    "layout": layout,
+                }
+            }
+        }
+    )
+    # Shared store: same file uploaded by anyone reuses this work
+    content_hash = pdf_entry.get("contentHash")
+    if content_hash:
+        now = _utc_iso()
+        shared = {
+            "text": page_text,
+            "imageTriage": image_triage or {},
+            "layout": layout,
+            "updatedAt": now,
+        }
+        # A failed Gemini call stays on this PDF only; shared, it would be
+        # served to everyone as already parsed
+        if explanation != NO_EXPLANATION:
+            shared[f"explanations.{_language_key(language)}"] = explanation
+        db.parsed_pages.update_one(
+            {"contentHash": content_hash, "pageNumber": page_no},
+            {
+                "$set": shared,
+                "$setOnInsert": {"createdAt": now},
+            },
+            upsert=True,
+        )
+
+def _extract_page_text(pdf_entry, page_no, doc=None):
+    stats = {}
+    # Known from upload metadata; None (older uploads) lets the parser check
+    scanned_pages = pdf_entry.get("scannedPages")
+    scanned = None if scanned_pages is None else page_no in scanned_pages
+    if parser_pool:
+        # CPU-heavy extraction/OCR/BLIP runs in a child process
+        text, layout = parser_pool.parse_page(
+            _get_local_pdf_path(pdf_entry), page_no, stats=stats, scanned=scanned
+        )
+    elif doc is not None:
+        text, layout = pdf_parser.process_page_layout(doc, page_no, stats, scanned)
+    else:
+        # Hold the pooled handle only while extracting; OCR/BLIP run after
+        # it is back, so renders and other parses of this PDF don't queue
+        with _borrow_pdf(pdf_entry) as doc:
+            prepared = pdf_parser.prepare_page(doc, page_no, scanned)
+        text, layout = pdf_parser.finish_page(prepared, stats)
+
+    # Per-document OCR/caption cache counters, shown by GET /pdf/<id>
+    cache_counters = stats.get("imageCache")
+    if cache_counters:
+        db.pdfs.update_one(
+            {"_id": pdf_entry["_id"]},
+            {"$inc": {f"imageCache.{name}": value for name, value in cache_counters.items()}},
+        )
+    # Per-page triage counters (images skipped and why) and the block layout
+    # are stored with the page
+    return text, stats.get("triage", {}), layout
+
+def _lookup_page(pdf_entry, page_no, language, doc=None):
+    """
+    Everything before the Gemini call, doing only the work that no one has
+    done before: own pages → shared store → parser.
+    Returns (status, text, explanation, image_triage, layout); explanation is
+    None when the page still has to be explained (and stored).
+    """
+    page = _find_own_page(pdf_entry, page_no)
+    if page:
+        return "already_parsed", page["text"], page["explanation"], None, None
+
+    shared = None
+    if pdf_entry.get("contentHash"):
+        shared = db.parsed_pages.find_one(
+            {"contentHash": pdf_entry["contentHash"], "pageNumber": page_no}
+        )
+
+    if shared:
+        explanation = (shared.get("explanations") or {}).get(_language_key(language))
+        image_triage = shared.get("imageTriage")
+        layout = shared.get("layout")
+        if explanation:
+            _store_page(pdf_entry, page_no, shared["text"], explanation, language, image_triage, layout)
+            return "already_parsed", shared["text"], explanation, image_triage, layout
+        # Text already extracted by someone else: skip OCR/BLIP
+        return "newly_parsed", shared["text"], None, image_triage, layout
+
+    page_text, image_triage, layout = _extract_page_text(pdf_entry, page_no, doc)
+    return "newly_parsed", page_text, None, image_triage, layout
+
+def _parse_and_store_page(pdf_entry, page_no, language, doc=None):
+    """
+    Returns (status, text, explanation) for a page (see _lookup_page), calling
+    Gemini only when needed. Pass doc to parse from an already-open document
+    (parse jobs).
+    """
+    status, page_text, explanation, image_triage, layout = _lookup_page(pdf_entry, page_no, language, doc)
+    if explanation is None:
+        explanation = _generate_explanation(page_text, language)
+        _store_page(pdf_entry, page_no, page_text, explanation, language, image_triage, layout)
+    return status, page_text, explanation
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or 0
+
+def _explanation_cache_key(page_text, language):
+    if not llm_cache:
+        return None
+    return llm_cache.key(page_text, _language_key(language), STUDENT_PROMPT_VERSION, GEMINI_MODEL)
+
+def _cached_explanation(cache_key):
+    return llm_cache.get(cache_key) if cache_key else None
+
+def _cache_explanation(cache_key, explanation, tokens, seconds):
+    if cache_key:
+        llm_cache.put(
+            cache_key, explanation, STUDENT_PROMPT_VERSION, GEMINI_MODEL,
+            tokens=tokens, seconds=seconds,
+        )
+
+def _generate_explanation(page_text, language):
+    """Gemini explanation of a page, from the LLM cache when the same text was explained before."""
+    cache_key = _explanation_cache_key(page_text, language)
+    cached = _cached_explanation(cache_key)
+    if cached is not None:
+        return cached
+
+    # Gemini Call
+    started = time.perf_counter()
+    response = gemini_client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=build_student_prompt(page_text, language)
+    )
+    if not response.text:
+        return NO_EXPLANATION
+    _cache_explanation(cache_key, response.text, _usage_tokens(response), time.perf_counter() - started)
+    return response.text
+
+# One parse of a page at a time, across request threads, prefetch, jobs and
+# workers (leases in db.page_leases)
+page_flight = SingleFlight(None if IN_PARSER_CHILD else db.page_leases)
+
+def _page_flight_key(pdf_entry, page_no):
+    return f"{pdf_entry['_id']}:{page_no}"
+
+def _reload_for_page(pdf_id, page_no):
+    # Just this page (it may have been stored since pdf_entry was read)
+    return db.pdfs.find_one(
+        {"_id": pdf_id},
+        {
+            "pages": {"$elemMatch": {"pageNumber": page_no}},
+            "pdfUrl": 1,
+            "contentHash": 1,
+            "pageCount": 1,
+            "scannedPages": 1,
+        },
+    )
+
+def _parse_page_once(pdf_entry, page_no, language, doc=None):
+    """
+    _parse_and_store_page under the page's single-flight key: concurrent
+    callers for the same page (double-clicks, tabs, prefetch, jobs, other
+    workers) wait for one parse instead of each running the pipeline.
+    """
+    if _find_own_page(pdf_entry, page_no):
+        return _parse_and_store_page(pdf_entry, page_no, language)
+
+    def run():
+        fresh = _reload_for_page(pdf_entry["_id"], page_no)
+        if not fresh:
+            raise ValueError("PDF not found")
+        return _parse_and_store_page(fresh, page_no, language, doc)
+
+    return page_flight.do(_page_flight_key(pdf_entry, page_no), run)
+
+def _prefetch_page(pdf_id, page_no, language):
+    pdf_entry = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+    if pdf_entry:
+        _parse_page_once(pdf_entry, page_no, language)
+
+# Background parses back off and retry on these instead of failing: the
+# parser pool is at capacity, or another worker is still on the page
+TRANSIENT_PARSE_ERRORS = (PoolBusy, SingleFlightTimeout)
+
+# Parses the next pages in the background while the student reads
+prefetcher = None if IN_PARSER_CHILD else PagePrefetcher(
+    _prefetch_page, transient_errors=TRANSIENT_PARSE_ERRORS
+)
+
+def _open_job_document(pdf_entry):
+    # Jobs get their own handle so a long walk doesn't hold the pooled one
+    return fitz.open(stream=_read_file(_get_local_pdf_path(pdf_entry)), filetype="pdf")
+
+def _parse_job_page(pdf_entry, doc, page_no, language):
+    # Re-check this page only (it may have been parsed since the job started)
+    fresh = _reload_for_page(pdf_entry["_id"], page_no)
+    if not fresh:
+        raise ValueError("PDF not found")
+    _parse_page_once(fresh, page_no, language, doc=doc)
+
+# Whole-document parse jobs (state in db.parse_jobs, resumable)
+parse_job_runner = None if IN_PARSER_CHILD else ParseJobRunner(
+    db, _open_job_document, _parse_job_page, transient_errors=TRANSIENT_PARSE_ERRORS
+)
+
+# --------------------------------------------------
+# Streaming (server-sent events)
+# --------------------------------------------------
+def _sse_event(event, data):
+    # JSON keeps newlines in the text inside a single data: line
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events, label):
+    """
+    text/event-stream response for a generator of _sse_event strings.
+    A failure mid-stream is sent as an `error` event. When the client
+    disconnects the server closes the generator, which closes the upstream
+    Gemini stream and skips the save that follows it.
+    """
+    def guarded():
+        try:
+            yield from events
+        except Exception as e:
+            print(f"{label} stream error:", e)
+            yield _sse_event("error", {"error": str(e)})
+
+    return Response(
+        guarded(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _stream_gemini(prompt, result):
+    """
+    Yields a `delta` event per chunk of Gemini's streamed answer. Once the
+    stream has ended, result holds text, tokens and seconds.
+    """
+    started = time.perf_counter()
+    stream = gemini_client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt)
+    parts = []
+    tokens = 0
+    try:
+        for chunk in stream:
+            if chunk.text:
+                parts.append(chunk.text)
+                yield _sse_event("delta", {"text": chunk.text})
+            # Usage is reported on the last chunk
+            tokens = _usage_tokens(chunk) or tokens
+    finally:
+        # Stop pulling tokens if the client went away
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    result.update(text="".join(parts), tokens=tokens, seconds=time.perf_counter() - started)
+
 # --------------------------------------------------
 # Routes
 # --------------------------------------------------
@@ -201,24 +611,60 @@ def upload_pdf():
         if "file" not in request.files:
             return jsonify({"error": "File missing"}), 400
         file = request.files["file"]
-        upload_result = cloudinary.uploader.upload(
-            file,
-            resource_type="raw",
-            folder="RagBot_PDFs"
-        )
+
+        # Hash while copying into the local blob cache (no full read into memory)
+        content_hash, blob_path = pdf_cache.ingest_stream(file.stream)
+        blob = db.blobs.find_one({"_id": content_hash})
+        if blob:
+            # Same file was uploaded before: reuse its Cloudinary copy + metadata
+            pdf_url = blob["pdfUrl"]
+            if blob.get("metadataVersion", 0) >= METADATA_VERSION:
+                pdf_meta = {k: blob[k] for k in METADATA_FIELDS if k in blob}
+            else:
+                # Recorded by an older version: extract again and update it
+                pdf_meta = extract_pdf_metadata_from_path(blob_path)
+                db.blobs.update_one({"_id": content_hash}, {"$set": pdf_meta})
+        else:
+            try:
+                pdf_meta = extract_pdf_metadata_from_path(blob_path)
+            except Exception as e:
+                pdf_cache.discard(content_hash)
+                return jsonify({"error": f"Invalid PDF: {e}"}), 400
+            upload_result = cloudinary.uploader.upload(
+                blob_path,
+                resource_type="raw",
+                folder="RagBot_PDFs"
+            )
+            pdf_url = upload_result["url"]
+            try:
+                db.blobs.insert_one({
+                    "_id": content_hash,
+                    "pdfUrl": pdf_url,
+                    "createdAt": _utc_iso(),
+                    **pdf_meta,
+                })
+            except DuplicateKeyError:
+                # A concurrent upload of the same file won the race
+                pdf_url = db.blobs.find_one({"_id": content_hash})["pdfUrl"]
+
         user_id = _get_optional_user_id()
         pdf_data = {
             "fileName": file.filename,
-            "pdfUrl": upload_result["url"],
+            "pdfUrl": pdf_url,
+            "contentHash": content_hash,
             "ownerUserId": user_id,
             "createdAt": _utc_iso(),
             "pages": [],
             "chatHistory": [],
             # Student utilities (new docs will have these; old docs remain compatible)
             "revisionPacks": [],
-            "doubtNotes": []
+            "doubtNotes": [],
+            # pageCount, pageSizes, outline, textLayerPages, byteSize
+            **pdf_meta,
         }
         result = db.pdfs.insert_one(pdf_data)
+        pdf_cache.link(result.inserted_id, content_hash)
+        background_executor.submit(_generate_thumbnails, pdf_data)
         return jsonify({
             "message": "PDF Uploaded Successfully 🔥",
             "pdf_id": str(result.inserted_id)
@@ -226,82 +672,133 @@ def upload_pdf():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _load_parse_request(data):
+    """
+    Validates a /parse-page body and cancels a queued prefetch of the same page.
+    Returns (error_response, None) or (None, (pdf_entry, page_no, language)).
+    """
+    pdf_id = data.get("pdf_id")
+    page_no = int(data.get("page_no"))
+    language = data.get("language", "english")
+
+    # Validate page number
+    if page_no <= 0:
+        return (jsonify({"error": "Invalid page number"}), 400), None
+
+    # Check PDF
+    try:
+        pdf_id_obj = ObjectId(pdf_id)
+    except InvalidId:
+        return (jsonify({"error": "Invalid PDF ID"}), 400), None
+
+    pdf_entry = db.pdfs.find_one({"_id": pdf_id_obj})
+    if not pdf_entry:
+        return (jsonify({"error": "PDF not found"}), 404), None
+    if pdf_entry.get("pageCount") and page_no > pdf_entry["pageCount"]:
+        return (jsonify({"error": "Invalid page number"}), 400), None
+
+    # Queued for prefetch but not started: parse it now instead. A prefetch
+    # already running is joined through the page's single-flight key
+    prefetcher.cancel(pdf_id, page_no, language)
+    return None, (pdf_entry, page_no, language)
+
+def _page_viewed(pdf_entry, page_no, language):
+    prefetcher.on_page_viewed(
+        _get_optional_user_id() or request.remote_addr,
+        str(pdf_entry["_id"]),
+        page_no,
+        language,
+        pdf_entry.get("pageCount"),
+    )
+
 @app.route("/parse-page", methods=["POST"])
 def parse_page():
     try:
-        data = request.json
-        pdf_id = data.get("pdf_id")
-        page_no = int(data.get("page_no"))
-        language = data.get("language", "english")
-        
-        # Validate page number
-        if page_no <= 0:
-            return jsonify({"error": "Invalid page number"}), 400
-        
-        # Check PDF
-        try:
-            pdf_id_obj = ObjectId(pdf_id)
-        except InvalidId:
-            return jsonify({"error": "Invalid PDF ID"}), 400
+        error, parse_request = _load_parse_request(request.json)
+        if error:
+            return error
+        pdf_entry, page_no, language = parse_request
 
-        pdf_entry = db.pdfs.find_one({"_id": pdf_id_obj})
-        if not pdf_entry:
-            return jsonify({"error": "PDF not found"}), 404
-        # Already parsed?
-        for page in pdf_entry.get("pages", []):
-            if page["pageNumber"] == page_no:
-                return jsonify({
-                    "status": "already_parsed",
-                    "pageNumber": page_no,
-                    "text": page["text"],
-                    "explanation": page["explanation"]
-                }), 200
-        # Download PDF with unique temp file
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}.pdf")
-        try:
-            r = requests.get(pdf_entry["pdfUrl"], timeout=15)
-            with open(temp_path, "wb") as f:
-                f.write(r.content)
-
-            page_text = pdf_parser.process_single_page(temp_path, page_no)
-
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        # Gemini Prompt
-        prompt = build_student_prompt(page_text, language)
-        # Gemini Call
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt
-        )
-        explanation = response.text or "Unable to generate explanation."
-        # Save to DB
-        db.pdfs.update_one(
-            {"_id": ObjectId(pdf_id)},
-            {
-                "$push": {
-                    "pages": {
-                        "pageNumber": page_no,
-                        "text": page_text,
-                        "explanation": explanation
-                    }
-                }
-            }
-        )
-        # Cleanup
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        status, page_text, explanation = _parse_page_once(pdf_entry, page_no, language)
+
+        _page_viewed(pdf_entry, page_no, language)
         return jsonify({
-            "status": "newly_parsed",
+            "status": status,
             "pageNumber": page_no,
             "text": page_text,
             "explanation": explanation
         }), 200
+    except PoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except (PoolTaskTimeout, SingleFlightTimeout) as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/parse-page/stream", methods=["POST"])
+def parse_page_stream():
+    """
+    /parse-page as server-sent events: `page` (text, once extracted), then
+    `delta` events while Gemini writes, then `done` with the full
+    explanation, which is stored only once the stream completes.
+    Already-explained pages (own, shared, LLM cache) get `page` + `done` at once.
+    """
+    try:
+        error, parse_request = _load_parse_request(request.json)
+        if error:
+            return error
+        pdf_entry, page_no, language = parse_request
+        _page_viewed(pdf_entry, page_no, language)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def events():
+        entry = pdf_entry
+        flight = None
+        if not _find_own_page(pdf_entry, page_no):
+            # Same single-flight key as /parse-page, held while streaming
+            flight, result = page_flight.acquire(_page_flight_key(pdf_entry, page_no))
+            if flight is None:
+                status, page_text, explanation = result
+                yield _sse_event("page", {"status": status, "pageNumber": page_no, "text": page_text})
+                yield _sse_event("done", {"status": status, "pageNumber": page_no, "explanation": explanation})
+                return
+
+        try:
+            if flight:
+                entry = _reload_for_page(pdf_entry["_id"], page_no)
+                if not entry:
+                    raise ValueError("PDF not found")
+            status, page_text, explanation, image_triage, layout = _lookup_page(entry, page_no, language)
+            yield _sse_event("page", {"status": status, "pageNumber": page_no, "text": page_text})
+
+            if explanation is None:
+                cache_key = _explanation_cache_key(page_text, language)
+                explanation = _cached_explanation(cache_key)
+                if explanation is None:
+                    result = {}
+                    yield from _stream_gemini(build_student_prompt(page_text, language), result)
+                    explanation = result["text"] or NO_EXPLANATION
+                    if result["text"]:
+                        _cache_explanation(cache_key, explanation, result["tokens"], result["seconds"])
+                _store_page(entry, page_no, page_text, explanation, language, image_triage, layout)
+        except BaseException as e:
+            if flight:
+                if not isinstance(e, Exception):
+                    e = RuntimeError("Page stream was closed before the explanation finished")
+                page_flight.finish(flight, error=e)
+            raise
+        if flight:
+            page_flight.finish(flight, (status, page_text, explanation))
+
+        yield _sse_event("done", {
+            "status": status,
+            "pageNumber": page_no,
+            "explanation": explanation,
+        })
+
+    return _sse_response(events(), "parse_page")
+
 # ---------------- DOUBT CHAT ----------------
 def format_recent_history(history, limit=5):
     recent = history[-(limit * 2):]
@@ -326,6 +823,11 @@ Page {page_no}
 Answer clearly like a teacher.
 """
 
+def _image_cache_summary(counters):
+    hits = counters.get("ocrHits", 0) + counters.get("captionHits", 0)
+    lookups = hits + counters.get("ocrMisses", 0) + counters.get("captionMisses", 0)
+    return dict(counters, hitRate=round(hits / lookups, 3) if lookups else None)
+
 @app.route("/pdf/<pdf_id>", methods=["GET"])
 def get_pdf_info(pdf_id):
     try:
@@ -334,111 +836,320 @@ def get_pdf_info(pdf_id):
         except InvalidId:
             return jsonify({"error": "Invalid PDF ID"}), 400
 
-        pdf_entry = db.pdfs.find_one({"_id": pdf_id_obj})
+        pdf_entry = db.pdfs.find_one(
+            {"_id": pdf_id_obj},
+            {
+                "fileName": 1,
+                "pdfUrl": 1,
+                "contentHash": 1,
+                "pageCount": 1,
+                "pageSizes": 1,
+                "outline": 1,
+                "pages.pageNumber": 1,
+                "imageCache": 1,
+            },
+        )
         if not pdf_entry:
             return jsonify({"error": "PDF not found"}), 404
-        
-        # Get total pages by downloading and checking PDF
-        try:
-            r = requests.get(pdf_entry["pdfUrl"], timeout=10)
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}.pdf")
-            with open(temp_path, "wb") as f:
-                f.write(r.content)
-            doc = fitz.open(temp_path)
-            total_pages = len(doc)
-            doc.close()
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception as e:
-            print(f"Error getting total pages: {e}")
-            total_pages = 1  # Default fallback
-        
+
+        # Older uploads have no stored metadata. Linearized PDFs carry their
+        # page count in the first KB, so try a small Range read before
+        # falling back to the full download.
+        if pdf_entry.get("pageCount") is None and pdf_entry.get("pdfUrl"):
+            try:
+                head = http_fetcher.fetch_head_bytes(pdf_entry["pdfUrl"])
+                page_count = page_count_from_linearized_head(head)
+                if page_count:
+                    pdf_entry["pageCount"] = page_count
+                    db.pdfs.update_one({"_id": pdf_entry["_id"]}, {"$set": {"pageCount": page_count}})
+            except Exception as e:
+                print(f"Range probe failed: {e}")
+        if pdf_entry.get("pageCount") is None:
+            try:
+                pdf_entry.update(_backfill_pdf_metadata(pdf_entry))
+            except Exception as e:
+                print(f"Error computing PDF metadata: {e}")
+                return jsonify({"error": "Could not read PDF"}), 502
+        total_pages = pdf_entry["pageCount"]
+
         return jsonify({
             "pdf_id": pdf_id,
             "fileName": pdf_entry.get("fileName", "Unknown"),
             "totalPages": total_pages,
             "parsedPages": len(pdf_entry.get("pages", [])),
-            "pdfUrl": pdf_entry.get("pdfUrl", "")
+            "pdfUrl": pdf_entry.get("pdfUrl", ""),
+            "pageSizes": pdf_entry.get("pageSizes", []),
+            "outline": pdf_entry.get("outline", []),
+            "imageCache": _image_cache_summary(pdf_entry.get("imageCache") or {}),
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/pdf/<pdf_id>/page/<int:page_no>/image", methods=["GET"])
-def get_pdf_page_image(pdf_id, page_no):
+@app.route("/pdf/<pdf_id>/page/<int:page_no>/layout", methods=["GET"])
+def get_pdf_page_layout(pdf_id, page_no):
+    """Structured blocks (kind, bbox, font size, text) of a parsed page."""
     try:
         try:
-           pdf_id_obj = ObjectId(pdf_id)
+            pdf_id_obj = ObjectId(pdf_id)
         except InvalidId:
-           return jsonify({"error": "Invalid PDF ID"}), 400
+            return jsonify({"error": "Invalid PDF ID"}), 400
 
-        pdf_entry = db.pdfs.find_one({"_id": pdf_id_obj})
+        pdf_entry = db.pdfs.find_one(
+            {"_id": pdf_id_obj},
+            {"pages": {"$elemMatch": {"pageNumber": page_no}}},
+        )
         if not pdf_entry:
             return jsonify({"error": "PDF not found"}), 404
-        
-        # Download PDF
-        r = requests.get(pdf_entry["pdfUrl"], timeout=10)
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}.pdf")
-        with open(temp_path, "wb") as f:
-            f.write(r.content)
-        
-        # Open PDF and get page
-        doc = fitz.open(temp_path)
-        if page_no < 1 or page_no > len(doc):
-            doc.close()
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            return jsonify({"error": "Invalid page number"}), 400
-        
-        page = doc[page_no - 1]  # 0-indexed
-        
-        # Render page to image (scale factor 2 for better quality)
-        mat = fitz.Matrix(2, 2)
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Convert to base64
-        img_data = pix.tobytes("png")
-        img_base64 = base64.b64encode(img_data).decode("utf-8")
-        img_url = f"data:image/png;base64,{img_base64}"
-        
-        doc.close()
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        return jsonify({"image": img_url}), 200
+        pages = pdf_entry.get("pages") or []
+        if not pages:
+            return jsonify({"error": "Page not parsed yet"}), 400
+        if not pages[0].get("layout"):
+            return jsonify({"error": "No layout stored for this page"}), 404
+
+        return jsonify({
+            "pdf_id": pdf_id,
+            "pageNumber": page_no,
+            "layout": pages[0]["layout"],
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/ask-doubt", methods=["POST"])
-def ask_doubt():
+# ---------------- PAGE IMAGES ----------------
+def _negotiate_image_format():
+    fmt = request.args.get("format")
+    if fmt in IMAGE_MIMETYPES:
+        return fmt
+    mimetype = request.accept_mimetypes.best_match(
+        list(IMAGE_MIMETYPES.values()), default="image/png"
+    )
+    return next(k for k, v in IMAGE_MIMETYPES.items() if v == mimetype)
+
+def _load_pdf_for_render(pdf_id, page_no=None):
+    """Returns (pdf_entry, None) or (None, error_response)."""
     try:
-        data = request.json
-        pdf_id = data.get("pdf_id")
-        page_no = int(data.get("page_no"))
-        query = data.get("query")
+        pdf_id_obj = ObjectId(pdf_id)
+    except InvalidId:
+        return None, (jsonify({"error": "Invalid PDF ID"}), 400)
+
+    pdf_entry = db.pdfs.find_one(
+        {"_id": pdf_id_obj},
+        {"pdfUrl": 1, "contentHash": 1, "pageCount": 1},
+    )
+    if not pdf_entry:
+        return None, (jsonify({"error": "PDF not found"}), 404)
+
+    page_count = pdf_entry.get("pageCount")
+    if page_no is not None and (page_no < 1 or (page_count and page_no > page_count)):
+        return None, (jsonify({"error": "Invalid page number"}), 400)
+
+    if not pdf_entry.get("contentHash"):
+        _get_local_pdf_path(pdf_entry)  # records contentHash
+    return pdf_entry, None
+
+def _cached_image_response(pdf_entry, page_no, cache_key, fmt, render):
+    """
+    Serve render(page) -> bytes through the render cache. The same key always
+    renders the same bytes, so the key doubles as a strong ETag.
+    """
+    if request.if_none_match.contains(cache_key):
+        response = Response(status=304)
+    else:
+        def _fill(tmp_path):
+            with _borrow_pdf(pdf_entry) as doc:
+                if page_no > len(doc):
+                    raise IndexError("Invalid page number")
+                img_data = render(doc[page_no - 1])
+            with open(tmp_path, "wb") as f:
+                f.write(img_data)
+
+        try:
+            img_path = render_cache.get_or_fill(cache_key, _fill)
+        except IndexError as e:
+            return jsonify({"error": str(e)}), 400
+        response = Response(_read_file(img_path), mimetype=IMAGE_MIMETYPES[fmt])
+
+    response.set_etag(cache_key)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    response.headers["Vary"] = "Accept"
+    return response
+
+def _generate_thumbnails(pdf_entry, batch_size=8):
+    """Background: render and cache thumbnails for every page not cached yet."""
+    try:
+        content_hash = pdf_entry["contentHash"]
+        missing = [
+            n for n in range(1, (pdf_entry.get("pageCount") or 0) + 1)
+            if not render_cache.contains(thumbnail_cache_key(content_hash, n))
+        ]
+        # Small batches so interactive requests on the same PDF aren't
+        # blocked behind a 300-page pass
+        for i in range(0, len(missing), batch_size):
+            with _borrow_pdf(pdf_entry) as doc:
+                thumbs = list(render_thumbnails(doc, missing[i:i + batch_size]))
+            for page_no, img_data in thumbs:
+                render_cache.put_bytes(thumbnail_cache_key(content_hash, page_no), img_data)
+    except Exception as e:
+        print(f"Thumbnail generation failed for {pdf_entry.get('_id')}: {e}")
+
+@app.route("/pdf/<pdf_id>/page/<int:page_no>/image", methods=["GET"])
+def get_pdf_page_image(pdf_id, page_no):
+    """
+    Raw page image (WebP/JPEG/PNG by Accept or ?format=), cached on disk per
+    (pdf hash, page, scale, format) and revalidated with a strong ETag.
+    """
+    try:
+        pdf_entry, error = _load_pdf_for_render(pdf_id, page_no)
+        if error:
+            return error
+
+        scale = clamp_scale(request.args.get("scale"))
+        fmt = _negotiate_image_format()
+        cache_key = render_cache_key(pdf_entry["contentHash"], page_no, scale, fmt)
+        return _cached_image_response(
+            pdf_entry, page_no, cache_key, fmt,
+            lambda page: render_page(page, scale, fmt),
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/pdf/<pdf_id>/page/<int:page_no>/thumbnail", methods=["GET"])
+def get_pdf_page_thumbnail(pdf_id, page_no):
+    try:
+        pdf_entry, error = _load_pdf_for_render(pdf_id, page_no)
+        if error:
+            return error
+
+        fmt = _negotiate_image_format()
+        cache_key = thumbnail_cache_key(pdf_entry["contentHash"], page_no, fmt)
+        return _cached_image_response(
+            pdf_entry, page_no, cache_key, fmt,
+            lambda page: render_page(page, THUMBNAIL_SCALE, fmt),
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/pdf/<pdf_id>/thumbnails", methods=["GET"])
+def list_pdf_thumbnails(pdf_id):
+    try:
+        pdf_entry, error = _load_pdf_for_render(pdf_id)
+        if error:
+            return error
+
+        page_count = pdf_entry.get("pageCount") or 0
+        ready = sum(
+            1 for n in range(1, page_count + 1)
+            if render_cache.contains(thumbnail_cache_key(pdf_entry["contentHash"], n))
+        )
+        return jsonify({
+            "pdf_id": pdf_id,
+            "totalPages": page_count,
+            "ready": ready,
+            "thumbnails": [
+                f"/pdf/{pdf_id}/page/{n}/thumbnail" for n in range(1, page_count + 1)
+            ],
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/pdf/<pdf_id>/page/<int:page_no>/tile", methods=["GET"])
+def get_pdf_page_tile(pdf_id, page_no):
+    """
+    ?zoom=<z>&x=<col>&y=<row>: one TILE_SIZE square of the page at zoom, so a
+    viewer can show the thumbnail first and sharpen only the visible region.
+    """
+    try:
+        pdf_entry, error = _load_pdf_for_render(pdf_id, page_no)
+        if error:
+            return error
+
+        zoom = clamp_scale(request.args.get("zoom"), max_scale=MAX_TILE_ZOOM)
+        try:
+            col = int(request.args.get("x", 0))
+            row = int(request.args.get("y", 0))
+        except ValueError:
+            return jsonify({"error": "x and y must be integers"}), 400
+
+        fmt = _negotiate_image_format()
+        cache_key = tile_cache_key(pdf_entry["contentHash"], page_no, zoom, col, row, fmt)
+        return _cached_image_response(
+            pdf_entry, page_no, cache_key, fmt,
+            lambda page: render_tile(page, zoom, col, row, fmt),
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ---------------- PARSE JOBS ----------------
+@app.route("/pdf/<pdf_id>/parse-jobs", methods=["POST"])
+def create_parse_job(pdf_id):
+    """
+    Parse a page range in the background.
+    Body: { "start_page": 1, "end_page": <last>, "language": "english" }
+    """
+    try:
+        data = request.json or {}
         language = data.get("language", "english")
-        # Fetch PDF
-        pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
-        if not pdf:
+        try:
+            pdf_id_obj = ObjectId(pdf_id)
+        except InvalidId:
+            return jsonify({"error": "Invalid PDF ID"}), 400
+
+        pdf_entry = db.pdfs.find_one(
+            {"_id": pdf_id_obj},
+            {"ownerUserId": 1, "pageCount": 1, "pdfUrl": 1, "contentHash": 1},
+        )
+        if not pdf_entry:
             return jsonify({"error": "PDF not found"}), 404
-        # Fetch page text
-        page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
-        if not page:
-            return jsonify({"error": "Page not parsed yet"}), 400
-        # Build last 5 chat turns
-        history = pdf.get("chatHistory", [])
-        recent_history = history[-10:]
-        history_text = ""
-        for msg in recent_history:
-            role = "STUDENT" if msg["role"] == "user" else "AI_TEACHER"
-            history_text += f"\n<{role}>\n{msg['parts'][0]['text']}\n</{role}>\n"
-        # Build prompt with context and language
-        prompt = f"""
+
+        user_id = _get_optional_user_id()
+        owner = pdf_entry.get("ownerUserId")
+        if owner and owner != user_id:
+            return jsonify({"error": "Not allowed"}), 403
+
+        page_count = pdf_entry.get("pageCount")
+        if page_count is None:
+            page_count = _backfill_pdf_metadata(pdf_entry)["pageCount"]
+
+        try:
+            start_page = int(data.get("start_page", 1))
+            end_page = int(data.get("end_page", page_count))
+        except (TypeError, ValueError):
+            return jsonify({"error": "start_page and end_page must be integers"}), 400
+        if start_page < 1 or end_page > page_count or start_page > end_page:
+            return jsonify({"error": f"Invalid page range (PDF has {page_count} pages)"}), 400
+
+        job = parse_job_runner.create_job(
+            pdf_entry, list(range(start_page, end_page + 1)), language, user_id
+        )
+        return jsonify({"job": ParseJobRunner.progress(job)}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/pdf/<pdf_id>/parse-jobs/<job_id>", methods=["GET"])
+def get_parse_job(pdf_id, job_id):
+    try:
+        try:
+            query = {"_id": ObjectId(job_id), "pdfId": ObjectId(pdf_id)}
+        except InvalidId:
+            return jsonify({"error": "Invalid id"}), 400
+
+        job = db.parse_jobs.find_one(query)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        owner = job.get("ownerUserId")
+        if owner and owner != _get_optional_user_id():
+            return jsonify({"error": "Not allowed"}), 403
+
+        return jsonify({"job": ParseJobRunner.progress(job)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def build_teacher_prompt(language, page_no, page_text, history_text, query):
+    return f"""
 LANGUAGE: {language} (hinglish = Hindi+English mix, hindi = pure Hindi, english = English)
 <PAGE_CONTEXT>
 Page {page_no}
-{page['text']}
+{page_text}
 </PAGE_CONTEXT>
 <PREVIOUS_CONVERSATION>
 {history_text}
@@ -452,61 +1163,127 @@ Answer clearly like a teacher in the requested language. Use Markdown formatting
 - Use bullet points (-) and numbered lists
 - Make it well-structured and organized
 """
+
+NO_ANSWER = "Unable to generate answer. Please try again."
+
+def _load_doubt_request(data):
+    """
+    Validates an /ask-doubt body. Returns (error_response, None) or
+    (None, (pdf_id, query, prompt)).
+    """
+    pdf_id = data.get("pdf_id")
+    page_no = int(data.get("page_no"))
+    query = data.get("query")
+    language = data.get("language", "english")
+    # Fetch PDF
+    pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+    if not pdf:
+        return (jsonify({"error": "PDF not found"}), 404), None
+    # Fetch page text
+    page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
+    if not page:
+        return (jsonify({"error": "Page not parsed yet"}), 400), None
+    # Build last 5 chat turns
+    history = pdf.get("chatHistory", [])
+    recent_history = history[-10:]
+    history_text = ""
+    for msg in recent_history:
+        role = "STUDENT" if msg["role"] == "user" else "AI_TEACHER"
+        history_text += f"\n<{role}>\n{msg['parts'][0]['text']}\n</{role}>\n"
+    # Build prompt with context and language
+    prompt = build_teacher_prompt(language, page_no, page['text'], history_text, query)
+    return None, (pdf_id, query, prompt)
+
+def _save_doubt(pdf_id, query, answer):
+    # Save Q&A to DB
+    new_entries = [
+        {"role": "user", "parts": [{"text": query}]},
+        {"role": "model", "parts": [{"text": answer}]}
+    ]
+    db.pdfs.update_one(
+        {"_id": ObjectId(pdf_id)},
+        {"$push": {"chatHistory": {"$each": new_entries}}}
+    )
+
+@app.route("/ask-doubt", methods=["POST"])
+def ask_doubt():
+    try:
+        error, doubt = _load_doubt_request(request.json)
+        if error:
+            return error
+        pdf_id, query, prompt = doubt
         # Call Gemini API
         response = gemini_client.models.generate_content(
             model=GEMINI_MODEL,
             contents=prompt
         )
-        answer = response.text or "Unable to generate answer. Please try again."
-        # Save Q&A to DB
-        new_entries = [
-            {"role": "user", "parts": [{"text": query}]},
-            {"role": "model", "parts": [{"text": answer}]}
-        ]
-        db.pdfs.update_one(
-            {"_id": ObjectId(pdf_id)},
-            {"$push": {"chatHistory": {"$each": new_entries}}}
-        )
+        answer = response.text or NO_ANSWER
+        _save_doubt(pdf_id, query, answer)
         return jsonify({"answer": answer}), 200
     except Exception as e:
         print("ask_doubt error:", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/generate-quiz", methods=["POST"])
-def generate_quiz():
+@app.route("/ask-doubt/stream", methods=["POST"])
+def ask_doubt_stream():
+    """/ask-doubt as server-sent events: `delta` events, then `done` (saved to chatHistory only then)."""
     try:
-        data = request.json
-        pdf_id = data.get("pdf_id")
-        page_numbers = data.get("page_numbers", [])  # List of page numbers
-        language = data.get("language", "english")
-        num_questions = data.get("num_questions", 5)
-        
-        if not page_numbers:
-            return jsonify({"error": "Please select at least one page"}), 400
-        
-        # Fetch PDF
-        pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
-        if not pdf:
-            return jsonify({"error": "PDF not found"}), 404
-        
-        # Collect text from selected pages
-        selected_pages_text = ""
-        for page_no in page_numbers:
-            page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
-            if page:
-                selected_pages_text += f"\n\n--- PAGE {page_no} ---\n{page['text']}\n"
-        
-        if not selected_pages_text:
-            return jsonify({"error": "Selected pages not parsed yet"}), 400
-        
-        # Build quiz generation prompt
-        prompt = f"""
+        error, doubt = _load_doubt_request(request.json)
+        if error:
+            return error
+        pdf_id, query, prompt = doubt
+    except Exception as e:
+        print("ask_doubt error:", e)
+        return jsonify({"error": str(e)}), 500
+
+    def events():
+        result = {}
+        yield from _stream_gemini(prompt, result)
+        answer = result["text"] or NO_ANSWER
+        _save_doubt(pdf_id, query, answer)
+        yield _sse_event("done", {"answer": answer})
+
+    return _sse_response(events(), "ask_doubt")
+
+def _selected_pages(pdf, page_numbers, require_text=False):
+    """(page_no, text) of the selected pages that are parsed, in selection order."""
+    selected = []
+    for page_no in page_numbers:
+        page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
+        if page and (page.get("text") or not require_text):
+            selected.append((page_no, page["text"]))
+    return selected
+
+def _use_map_reduce(mode, chunks):
+    # auto: one prompt when the whole selection fits in one chunk
+    return mode == "map_reduce" or (mode != "single" and len(chunks) > 1)
+
+def _generate_json(prompt):
+    """Gemini call whose answer must be JSON (raises ValueError if it isn't)."""
+    response = gemini_client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt
+    )
+    text = _strip_markdown_code_fences(response.text or "{}")
+    return json.loads(_extract_first_json_block(text))
+
+def _map_reduce_summary(chunks, results):
+    return {
+        "mode": "map_reduce",
+        "chunks": len(chunks),
+        "chunkPages": [c.page_numbers for c in chunks],
+        "chunkTokens": [c.tokens for c in chunks],
+        "failedChunks": sum(isinstance(r, Exception) for r in results),
+    }
+
+def build_quiz_prompt(language, num_questions, page_numbers, content):
+    return f"""
 LANGUAGE: {language} (hinglish = Hindi+English mix, hindi = pure Hindi, english = English)
 
 TASK: Generate {num_questions} multiple choice questions (MCQs) based on the following content from pages {', '.join(map(str, page_numbers))}.
 
 CONTENT:
-{selected_pages_text}
+{content}
 
 REQUIREMENTS:
 - Generate exactly {num_questions} questions
@@ -535,6 +1312,60 @@ FORMAT (JSON):
 
 Return ONLY valid JSON, no other text.
 """
+
+@app.route("/generate-quiz", methods=["POST"])
+def generate_quiz():
+    """
+    MCQs over the selected pages. Selections larger than one token-budgeted
+    chunk are map-reduced: questions are generated per chunk concurrently,
+    then merged and de-duplicated. mode: auto (default) | single | map_reduce.
+    """
+    try:
+        data = request.json
+        pdf_id = data.get("pdf_id")
+        page_numbers = data.get("page_numbers", [])  # List of page numbers
+        language = data.get("language", "english")
+        mode = data.get("mode", "auto")
+        # Clients send it as a number or a numeric string
+        try:
+            num_questions = int(data.get("num_questions", 5))
+        except (TypeError, ValueError):
+            num_questions = 0
+        if num_questions <= 0:
+            return jsonify({"error": "num_questions must be a positive whole number"}), 400
+        
+        if not page_numbers:
+            return jsonify({"error": "Please select at least one page"}), 400
+        
+        # Fetch PDF
+        pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+        if not pdf:
+            return jsonify({"error": "PDF not found"}), 404
+        
+        # Collect text from selected pages
+        pages = _selected_pages(pdf, page_numbers)
+        if not pages:
+            return jsonify({"error": "Selected pages not parsed yet"}), 400
+
+        chunks = chunk_pages(pages)
+        if _use_map_reduce(mode, chunks):
+            # Each chunk covers its share of the questions, plus a spare to
+            # make up for duplicates across chunks
+            shares = allocate(num_questions, [c.tokens for c in chunks])
+            prompts = [
+                build_quiz_prompt(language, max(1, share + 1), chunk.page_numbers, chunk.text)
+                for chunk, share in zip(chunks, shares)
+            ]
+            results = map_reducer.map(prompts, _generate_json)
+            if all(isinstance(r, Exception) for r in results):
+                quiz_data = {"error": "Failed to parse quiz", "raw_response": str(results[0])}
+            else:
+                quiz_data = merge_quiz(results, [c.tokens for c in chunks], num_questions)
+            return jsonify({"quiz": quiz_data, "generation": _map_reduce_summary(chunks, results)}), 200
+
+        # Build quiz generation prompt
+        selected_pages_text = "".join(page_block(page_no, text) for page_no, text in pages)
+        prompt = build_quiz_prompt(language, num_questions, page_numbers, selected_pages_text)
         
         # Call Gemini API
         response = gemini_client.models.generate_content(
@@ -553,59 +1384,21 @@ Return ONLY valid JSON, no other text.
             # Fallback: return raw text if JSON parsing fails
             quiz_data = {"error": "Failed to parse quiz", "raw_response": quiz_text}
         
-        return jsonify({"quiz": quiz_data}), 200
+        return jsonify({"quiz": quiz_data, "generation": {"mode": "single", "chunks": 1}}), 200
     except Exception as e:
         print("generate_quiz error:", e)
         return jsonify({"error": str(e)}), 500
 
 # ---------------- REVISION PACK ----------------
-@app.route("/generate-revision-pack", methods=["POST"])
-def generate_revision_pack():
-    """
-    Generates a compact revision pack from selected pages and stores it on the PDF:
-    - notes (Markdown)
-    - key terms
-    - flashcards (active recall)
-    - exam-style questions
-    """
-    try:
-        data = request.json or {}
-        pdf_id = data.get("pdf_id")
-        page_numbers = data.get("page_numbers", [])
-        language = data.get("language", "english")
-        title = (data.get("title") or "").strip()
-
-        if not pdf_id:
-            return jsonify({"error": "pdf_id is required"}), 400
-        if not page_numbers:
-            return jsonify({"error": "Please select at least one page"}), 400
-
-        pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
-        if not pdf:
-            return jsonify({"error": "PDF not found"}), 404
-
-        # Collect text from selected pages (must be parsed already)
-        selected_pages_text = ""
-        for page_no in page_numbers:
-            page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
-            if page and page.get("text"):
-                selected_pages_text += f"\n\n--- PAGE {page_no} ---\n{page['text']}\n"
-
-        if not selected_pages_text:
-            return jsonify({"error": "Selected pages not parsed yet"}), 400
-
-        pack_id = uuid.uuid4().hex
-        created_at = _utc_iso()
-        effective_title = title or f"Revision Pack (Pages {', '.join(map(str, page_numbers))})"
-
-        prompt = f"""
+def build_revision_prompt(language, content):
+    return f"""
 LANGUAGE: {language} (hinglish = Hindi+English mix, hindi = pure Hindi, english = English)
 
 TASK: Create a compact "Revision Pack" for a student from the content below.
 Make it highly exam-oriented and easy to revise quickly.
 
 CONTENT:
-{selected_pages_text}
+{content}
 
 REQUIREMENTS:
 - Keep it short, but not vague (prioritize what is most likely asked in exams)
@@ -634,24 +1427,72 @@ FORMAT (JSON):
 Return ONLY valid JSON, no other text.
 """
 
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt
-        )
+@app.route("/generate-revision-pack", methods=["POST"])
+def generate_revision_pack():
+    """
+    Generates a compact revision pack from selected pages and stores it on the PDF:
+    - notes (Markdown)
+    - key terms
+    - flashcards (active recall)
+    - exam-style questions
+    Large selections are map-reduced like /generate-quiz (same `mode` field).
+    """
+    try:
+        data = request.json or {}
+        pdf_id = data.get("pdf_id")
+        page_numbers = data.get("page_numbers", [])
+        language = data.get("language", "english")
+        title = (data.get("title") or "").strip()
 
-        pack_text = _strip_markdown_code_fences(response.text or "{}")
-        pack_text = _extract_first_json_block(pack_text)
-        try:
-            pack_data = json.loads(pack_text)
-        except Exception:
-            pack_data = {"error": "Failed to parse revision pack", "raw_response": pack_text}
+        if not pdf_id:
+            return jsonify({"error": "pdf_id is required"}), 400
+        if not page_numbers:
+            return jsonify({"error": "Please select at least one page"}), 400
+
+        pdf = db.pdfs.find_one({"_id": ObjectId(pdf_id)})
+        if not pdf:
+            return jsonify({"error": "PDF not found"}), 404
+
+        # Collect text from selected pages (must be parsed already)
+        pages = _selected_pages(pdf, page_numbers, require_text=True)
+        if not pages:
+            return jsonify({"error": "Selected pages not parsed yet"}), 400
+
+        pack_id = uuid.uuid4().hex
+        created_at = _utc_iso()
+        effective_title = title or f"Revision Pack (Pages {', '.join(map(str, page_numbers))})"
+
+        chunks = chunk_pages(pages)
+        if _use_map_reduce(data.get("mode", "auto"), chunks):
+            # Notes/cards per chunk concurrently, then merged in page order
+            prompts = [build_revision_prompt(language, chunk.text) for chunk in chunks]
+            results = map_reducer.map(prompts, _generate_json)
+            if all(isinstance(r, Exception) for r in results):
+                pack_data = {"error": "Failed to parse revision pack", "raw_response": str(results[0])}
+            else:
+                pack_data = merge_revision_packs(results)
+            generation = _map_reduce_summary(chunks, results)
+        else:
+            selected_pages_text = "".join(page_block(page_no, text) for page_no, text in pages)
+            response = gemini_client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=build_revision_prompt(language, selected_pages_text)
+            )
+
+            pack_text = _strip_markdown_code_fences(response.text or "{}")
+            pack_text = _extract_first_json_block(pack_text)
+            try:
+                pack_data = json.loads(pack_text)
+            except Exception:
+                pack_data = {"error": "Failed to parse revision pack", "raw_response": pack_text}
+            generation = {"mode": "single", "chunks": 1}
 
         saved_pack = {
             "packId": pack_id,
             "createdAt": created_at,
             "language": language,
             "pageNumbers": page_numbers,
-            "title": pack_data.get("title", effective_title) if isinstance(pack_data, dict) else effective_title,
+            "title": (pack_data.get("title") or effective_title) if isinstance(pack_data, dict) else effective_title,
             "pack": pack_data,
         }
 
@@ -660,7 +1501,7 @@ Return ONLY valid JSON, no other text.
             {"$push": {"revisionPacks": saved_pack}}
         )
 
-        return jsonify({"revision_pack": saved_pack}), 200
+        return jsonify({"revision_pack": saved_pack, "generation": generation}), 200
     except Exception as e:
         print("generate_revision_pack error:", e)
         return jsonify({"error": str(e)}), 500
@@ -761,11 +1602,11 @@ def get_conversation(conversation_id):
 
     return jsonify({"conversation": _serialize_conversation(doc)}), 200
 
-@app.route("/api/conversations/<conversation_id>/messages", methods=["POST"])
-@jwt_required()
-def add_conversation_message(conversation_id):
-    user_id = get_jwt_identity()
-    data = request.json or {}
+def _load_conversation_request(conversation_id, user_id, data):
+    """
+    Validates a conversation message body. Returns (error_response, None) or
+    (None, (conv, query, page_no, prompt)).
+    """
     query = (data.get("query") or "").strip()
     language = data.get("language", "english")
 
@@ -775,31 +1616,31 @@ def add_conversation_message(conversation_id):
         page_no = None
 
     if not query:
-        return jsonify({"error": "query is required"}), 400
+        return (jsonify({"error": "query is required"}), 400), None
     if not page_no or page_no <= 0:
-        return jsonify({"error": "page_no is required"}), 400
+        return (jsonify({"error": "page_no is required"}), 400), None
 
     try:
         conv = db.conversations.find_one(
             {"_id": ObjectId(conversation_id), "userId": user_id}
         )
     except Exception:
-        return jsonify({"error": "Invalid conversation id"}), 400
+        return (jsonify({"error": "Invalid conversation id"}), 400), None
 
     if not conv:
-        return jsonify({"error": "Conversation not found"}), 404
+        return (jsonify({"error": "Conversation not found"}), 404), None
 
     pdf = db.pdfs.find_one({"_id": conv.get("pdfId")})
     if not pdf:
-        return jsonify({"error": "PDF not found"}), 404
+        return (jsonify({"error": "PDF not found"}), 404), None
 
     owner = pdf.get("ownerUserId")
     if owner and owner != user_id:
-        return jsonify({"error": "Not allowed"}), 403
+        return (jsonify({"error": "Not allowed"}), 403), None
 
     page = next((p for p in pdf.get("pages", []) if p["pageNumber"] == page_no), None)
     if not page:
-        return jsonify({"error": "Page not parsed yet"}), 400
+        return (jsonify({"error": "Page not parsed yet"}), 400), None
 
     recent = (conv.get("messages") or [])[-10:]
     history_text = ""
@@ -807,56 +1648,174 @@ def add_conversation_message(conversation_id):
         role = "STUDENT" if msg.get("role") == "user" else "AI_TEACHER"
         history_text += f"\n<{role}>\n{msg.get('text', '')}\n</{role}>\n"
 
-    prompt = f"""
-LANGUAGE: {language} (hinglish = Hindi+English mix, hindi = pure Hindi, english = English)
-<PAGE_CONTEXT>
-Page {page_no}
-{page.get('text', '')}
-</PAGE_CONTEXT>
-<PREVIOUS_CONVERSATION>
-{history_text}
-</PREVIOUS_CONVERSATION>
-<CURRENT_DOUBT>
-{query}
-</CURRENT_DOUBT>
-Answer clearly like a teacher in the requested language. Use Markdown formatting:
-- Use ## for main topics, ### for subtopics
-- Use **bold** for important terms
-- Use bullet points (-) and numbered lists
-- Make it well-structured and organized
-"""
-
-    response = gemini_client.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=prompt
-    )
-    answer = response.text or "Unable to generate answer. Please try again."
+    prompt = build_teacher_prompt(language, page_no, page.get('text', ''), history_text, query)
+    return None, (conv, query, page_no, prompt)
 
+def _save_conversation_message(conv, user_id, query, page_no, answer):
     now = _utc_iso()
     new_entries = [
         {"role": "user", "text": query, "pageNo": page_no, "createdAt": now},
         {"role": "model", "text": answer, "pageNo": page_no, "createdAt": now},
     ]
+    db.conversations.update_one(
+        {"_id": conv["_id"], "userId": user_id},
+        {
+            "$push": {"messages": {"$each": new_entries}},
+            "$set": {"updatedAt": now, "lastPageNo": page_no},
+        },
+    )
+
+@app.route("/api/conversations/<conversation_id>/messages", methods=["POST"])
+@jwt_required()
+def add_conversation_message(conversation_id):
+    user_id = get_jwt_identity()
+    error, message = _load_conversation_request(conversation_id, user_id, request.json or {})
+    if error:
+        return error
+    conv, query, page_no, prompt = message
+
+    response = gemini_client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt
+    )
+    answer = response.text or NO_ANSWER
 
     try:
-        db.conversations.update_one(
-            {"_id": conv["_id"], "userId": user_id},
-            {
-                "$push": {"messages": {"$each": new_entries}},
-                "$set": {"updatedAt": now, "lastPageNo": page_no},
-            },
-        )
+        _save_conversation_message(conv, user_id, query, page_no, answer)
     except Exception as e:
         return jsonify({"error": f"Failed to save message: {e}"}), 500
 
     return jsonify({"answer": answer}), 200
 
+@app.route("/api/conversations/<conversation_id>/messages/stream", methods=["POST"])
+@jwt_required()
+def add_conversation_message_stream(conversation_id):
+    """Conversation message as server-sent events: `delta` events, then `done` (saved only then)."""
+    user_id = get_jwt_identity()
+    error, message = _load_conversation_request(conversation_id, user_id, request.json or {})
+    if error:
+        return error
+    conv, query, page_no, prompt = message
+
+    def events():
+        result = {}
+        yield from _stream_gemini(prompt, result)
+        answer = result["text"] or NO_ANSWER
+        _save_conversation_message(conv, user_id, query, page_no, answer)
+        yield _sse_event("done", {"answer": answer})
+
+    return _sse_response(events(), "conversation_message")
+
+# ---------------- READINESS ----------------
+_warmup_lock = threading.Lock()
+_warmup_future = None
+# Own thread: background_executor can be busy with whole-document thumbnails
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="studymate-warmup")
+
+
+def _warmup_parser():
+    # With a process pool the children caption, so warm one of them instead
+    if parser_pool:
+        return parser_pool.warmup()
+    return warmup_blip()
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe for parse traffic: 200 once BLIP is loaded and has run a
+    warmup caption, 503 (and the warmup is started) until then.
+    ?wait=<seconds> blocks up to that long for the warmup to finish.
+    """
+    global _warmup_future
+    with _warmup_lock:
+        if _warmup_future is None or (_warmup_future.done() and _warmup_future.exception()):
+            _warmup_future = _warmup_executor.submit(_warmup_parser)
+        future = _warmup_future
+
+    try:
+        wait = min(max(float(request.args.get("wait", 0) or 0), 0), 300)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    if wait:
+        futures_wait([future], timeout=wait)
+
+    if not future.done():
+        status = blip_status() if not parser_pool else {"state": "loading"}
+        return jsonify({"ready": False, "model": status}), 503
+    if future.exception():
+        return jsonify({
+            "ready": False,
+            "model": dict(blip_status(), state="failed", error=str(future.exception())),
+        }), 503
+    return jsonify({"ready": True, "model": future.result()}), 200
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "pdfBlobCache": pdf_cache.stats(),
+        "documentPool": doc_pool.stats(),
+        "httpFetch": http_fetcher.stats(),
+        "renderCache": render_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "parserPool": parser_pool.stats() if parser_pool else None,
+        "captionBatcher": caption_batcher.stats(),
+        "ocrPool": ocr_pool.stats(),
+        "inferenceCache": inference_cache.stats() if inference_cache else None,
+        "llmCache": llm_cache.stats() if llm_cache else None,
+        "pageSingleFlight": page_flight.stats(),
+        "mapReduce": map_reducer.stats(),
+    }), 200
+
 @app.route("/api/me", methods=["GET"])
 @jwt_required()
 def me():
     user_id = get_jwt_identity()
     return jsonify({"userId": user_id}), 200
 
+# --------------------------------------------------
+# CLI: flask --app app backfill-pdf-metadata
+# --------------------------------------------------
+@app.cli.command("backfill-pdf-metadata")
+def backfill_pdf_metadata_command():
+    """
+    Store page count / sizes / outline on PDFs uploaded before metadata
+    existed (or with an older METADATA_VERSION), and on their blob records.
+    """
+    query = {
+        "$or": [
+            {"metadataVersion": {"$exists": False}},
+            {"metadataVersion": {"$lt": METADATA_VERSION}},
+        ]
+    }
+    cursor = db.pdfs.find(query, {"pdfUrl": 1, "contentHash": 1, "fileName": 1})
+    done, failed = 0, 0
+    for pdf_entry in cursor:
+        try:
+            pdf_meta = _backfill_pdf_metadata(pdf_entry)
+            done += 1
+            print(f"✅ {pdf_entry['_id']} {pdf_entry.get('fileName', '')}: {pdf_meta['pageCount']} pages")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {pdf_entry['_id']}: {e}")
+    print(f"Backfill finished: {done} updated, {failed} failed")
+
+# --------------------------------------------------
+# CLI: flask --app app invalidate-llm-cache [--all]
+# --------------------------------------------------
+@app.cli.command("invalidate-llm-cache")
+@click.option("--all", "drop_all", is_flag=True, help="Drop every cached explanation, not just stale ones.")
+def invalidate_llm_cache_command(drop_all):
+    """Drop cached page explanations from other prompt versions / models (or all of them)."""
+    if not llm_cache:
+        print("LLM cache is disabled (LLM_CACHE_TTL_DAYS=0)")
+        return
+    if drop_all:
+        removed = llm_cache.invalidate()
+    else:
+        removed = llm_cache.invalidate(STUDENT_PROMPT_VERSION, GEMINI_MODEL, keep=True)
+    print(f"Removed {removed} cached explanations")
+
 # --------------------------------------------------
 # Run App
 # --------------------------------------------------
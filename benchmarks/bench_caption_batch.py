@@ -0,0 +1,73 @@
+"""
+Per-image vs batched BLIP captioning throughput (CPU by default).
+
+    python benchmarks/bench_caption_batch.py --images 16 --batch 8
+
+max_batch=1 is the old one-generate-per-image path, so the first row is the
+"before" number and the batched rows are "after".
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_images(count, seed=0):
+    """Synthetic figures of mixed sizes (diagram-like shapes on noise)."""
+    rng = np.random.default_rng(seed)
+    sizes = [(160, 120), (320, 240), (640, 480), (400, 400), (800, 300)]
+    images = []
+    for i in range(count):
+        w, h = sizes[i % len(sizes)]
+        noise = rng.integers(180, 255, size=(h, w, 3), dtype=np.uint8)
+        image = Image.fromarray(noise, "RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x0, y0 = int(rng.integers(0, w // 2)), int(rng.integers(0, h // 2))
+            x1, y1 = x0 + int(rng.integers(10, w // 2)), y0 + int(rng.integers(10, h // 2))
+            color = tuple(int(c) for c in rng.integers(0, 200, size=3))
+            if rng.random() < 0.5:
+                draw.rectangle([x0, y0, x1, y1], outline=color, width=3)
+            else:
+                draw.ellipse([x0, y0, x1, y1], fill=color)
+        images.append(image)
+    return images
+
+
+def run(caption_images, images, max_batch, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        caption_images(images, max_batch=max_batch)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=16)
+    ap.add_argument("--batch", type=int, nargs="+", default=[4, 8, 16])
+    ap.add_argument("--repeats", type=int, default=2)
+    args = ap.parse_args()
+
+    from pdf_pipeline.parser import blip_status, caption_images
+
+    images = make_images(args.images)
+    caption_images(images[:2], max_batch=2)  # warm-up
+
+    print(f"device={blip_status()['device']} images={len(images)} repeats={args.repeats} (best of)")
+    print(f"{'max_batch':>10} {'seconds':>10} {'images/sec':>12} {'speedup':>8}")
+    baseline = run(caption_images, images, 1, args.repeats)
+    print(f"{1:>10} {baseline:>10.2f} {len(images) / baseline:>12.2f} {1.0:>8.2f}")
+    for batch in args.batch:
+        elapsed = run(caption_images, images, batch, args.repeats)
+        print(f"{batch:>10} {elapsed:>10.2f} {len(images) / elapsed:>12.2f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
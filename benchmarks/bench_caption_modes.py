@@ -0,0 +1,113 @@
+"""
+Accuracy/latency comparison of BLIP inference modes (BLIP_INFERENCE_MODE).
+
+    python benchmarks/bench_caption_modes.py --modes fp32 int8
+    python benchmarks/bench_caption_modes.py --images-dir path/to/figures
+
+Every mode captions the same fixed image set: the synthetic figures from
+bench_caption_batch.py, or every image in --images-dir (sorted by name).
+fp32 captions are the reference; other modes are scored against them by
+exact-match rate and mean token F1. Model size is the serialized state_dict.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_images(images_dir, count):
+    if not images_dir:
+        from bench_caption_batch import make_images
+        return make_images(count)
+    names = sorted(
+        n for n in os.listdir(images_dir)
+        if n.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".bmp"))
+    )
+    return [Image.open(os.path.join(images_dir, n)).convert("RGB") for n in names[:count]]
+
+
+def model_megabytes(model):
+    import torch
+
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / (1024 * 1024)
+
+
+def token_f1(candidate, reference):
+    cand, ref = candidate.lower().split(), reference.lower().split()
+    if not cand or not ref:
+        return float(cand == ref)
+    common = sum(min(cand.count(t), ref.count(t)) for t in set(cand))
+    if not common:
+        return 0.0
+    precision, recall = common / len(cand), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_mode(mode, images, batch, repeats):
+    from pdf_pipeline.parser import build_blip, caption_images
+
+    started = time.perf_counter()
+    blip = build_blip(mode)
+    load_seconds = time.perf_counter() - started
+
+    caption_images(images[:2], max_batch=2, blip=blip)  # warm-up
+    best = float("inf")
+    captions = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        captions = caption_images(images, max_batch=batch, blip=blip)
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        "mode": mode,
+        "device": blip[2],
+        "loadSeconds": load_seconds,
+        "modelMB": model_megabytes(blip[1]),
+        "secondsPerImage": best / len(images),
+        "captions": [c if isinstance(c, str) else f"ERROR: {c}" for c in captions],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", nargs="+", default=["fp32", "int8"])
+    ap.add_argument("--images-dir")
+    ap.add_argument("--images", type=int, default=16)
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("--repeats", type=int, default=2)
+    ap.add_argument("--json", help="also write full results (with captions) here")
+    args = ap.parse_args()
+
+    images = load_images(args.images_dir, args.images)
+    modes = ["fp32"] + [m for m in args.modes if m != "fp32"]
+    results = [run_mode(mode, images, args.batch, args.repeats) for mode in modes]
+
+    reference = results[0]
+    print(f"images={len(images)} batch={args.batch} repeats={args.repeats} (best of)")
+    print(f"{'mode':>6} {'device':>6} {'load s':>7} {'MB':>7} {'s/img':>7} {'speedup':>8} {'exact':>6} {'tokF1':>6}")
+    for r in results:
+        pairs = list(zip(r["captions"], reference["captions"]))
+        r["exactMatch"] = sum(a == b for a, b in pairs) / len(pairs)
+        r["tokenF1"] = sum(token_f1(a, b) for a, b in pairs) / len(pairs)
+        speedup = reference["secondsPerImage"] / r["secondsPerImage"]
+        print(
+            f"{r['mode']:>6} {r['device']:>6} {r['loadSeconds']:>7.1f} {r['modelMB']:>7.0f} "
+            f"{r['secondsPerImage']:>7.3f} {speedup:>8.2f} {r['exactMatch']:>6.2f} {r['tokenF1']:>6.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
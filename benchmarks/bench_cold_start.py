@@ -0,0 +1,77 @@
+"""
+Process cold-start cost of the parser module: lazy (default) vs eager BLIP.
+
+    python benchmarks/bench_cold_start.py --runs 3
+
+Each run is a fresh interpreter, so nothing is shared between measurements:
+
+- import:  `import pdf_pipeline.parser` (what every app worker pays at boot)
+- load:    load_blip(), i.e. torch/transformers import plus weights
+- warmup:  the first tiny caption after loading
+- eager:   import + load, the old import-time cost before BLIP was lazy
+
+Peak RSS is reported after import and after load.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+t0 = time.perf_counter()
+import pdf_pipeline.parser as parser
+t1 = time.perf_counter()
+import_rss = rss_mb()
+parser.load_blip()
+t2 = time.perf_counter()
+status = parser.warmup_blip()
+print(json.dumps({
+    "import": t1 - t0,
+    "load": t2 - t1,
+    "warmup": status["warmupMs"] / 1000,
+    "importRssMb": import_rss,
+    "loadedRssMb": rss_mb(),
+    "device": status["device"],
+}))
+"""
+
+
+def run_once():
+    env = dict(os.environ, BLIP_PRELOAD="0")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, ROOT],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    def best(key):
+        return min(r[key] for r in runs)
+
+    print(f"device={runs[0]['device']} runs={args.runs} (best of)")
+    print(f"{'phase':>8} {'seconds':>9}")
+    print(f"{'import':>8} {best('import'):>9.2f}")
+    print(f"{'load':>8} {best('load'):>9.2f}")
+    print(f"{'warmup':>8} {best('warmup'):>9.2f}")
+    print(f"{'eager':>8} {min(r['import'] + r['load'] for r in runs):>9.2f}")
+    print(f"peak RSS after import: {best('importRssMb'):.0f} MB, after load: {best('loadedRssMb'):.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
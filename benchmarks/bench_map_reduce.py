@@ -0,0 +1,150 @@
+"""
+Single-prompt vs map-reduce quiz generation over large page selections,
+against a local fake model (no API key or network needed).
+
+    python benchmarks/bench_map_reduce.py --pages 5 20 50
+    python benchmarks/bench_map_reduce.py --chunk-tokens 4000 --workers 8
+
+The fake model answers after a latency that grows with prompt and output
+tokens (--base-ms, --in-ms-per-1k, --out-ms-per-question), roughly how a
+hosted LLM behaves, and returns one MCQ per page it sees with a few exact
+and reworded duplicates. Reported per selection: chunks and their token
+budget, estimated prompt tokens, wall time of each mode, and how many of the
+requested questions came back unique.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_pipeline.map_reduce import (  # noqa: E402
+    MapReducer,
+    allocate,
+    chunk_pages,
+    estimate_tokens,
+    merge_quiz,
+    page_block,
+)
+
+# Close to the app's quiz prompt in size; the content is what varies
+PROMPT = """TASK: Generate {n} multiple choice questions (MCQs) based on the following content from pages {pages}.
+CONTENT:
+{content}
+REQUIREMENTS: exactly {n} questions, 4 options each, correct answer marked, JSON only.
+FORMAT (JSON): {{"questions": [{{"question": "...", "options": {{"A": "..."}}, "correct_answer": "A"}}]}}
+"""
+
+WORDS = (
+    "cell membrane osmosis diffusion energy enzyme protein glucose respiration photosynthesis "
+    "chlorophyll nucleus mitochondria ribosome tissue organ system equation velocity force mass"
+).split()
+
+
+def make_pages(count, words_per_page):
+    pages = []
+    for n in range(1, count + 1):
+        body = " ".join(WORDS[(n * 7 + i) % len(WORDS)] for i in range(words_per_page))
+        pages.append((n, f"Topic {n}. {body}"))
+    return pages
+
+
+class FakeModel:
+    def __init__(self, base_ms, in_ms_per_1k, out_ms_per_question):
+        self.base = base_ms / 1000
+        self.per_in_token = in_ms_per_1k / 1000 / 1000
+        self.per_question = out_ms_per_question / 1000
+
+    def generate(self, prompt):
+        wanted = int(re.search(r"Generate (\d+) multiple", prompt).group(1))
+        pages = [int(p) for p in re.findall(r"--- PAGE (\d+)", prompt)]
+        questions = []
+        for i in range(wanted):
+            page = pages[i % len(pages)]
+            if i % 4 == 3:
+                # Same question again, reworded slightly (near-duplicate)
+                text = f"Which statement about topic {page} is correct ?"
+            else:
+                text = f"Which statement about topic {page} is correct? (v{i // len(pages)})"
+            questions.append({"question": text, "options": {"A": "a", "B": "b", "C": "c", "D": "d"}, "correct_answer": "A"})
+        time.sleep(self.base + estimate_tokens(prompt) * self.per_in_token + wanted * self.per_question)
+        return {"questions": questions}
+
+
+def prompt_for(n, page_numbers, content):
+    return PROMPT.format(n=n, pages=", ".join(map(str, page_numbers)), content=content)
+
+
+def run_single(pages, model, num_questions):
+    content = "".join(page_block(n, t) for n, t in pages)
+    prompt = prompt_for(num_questions, [n for n, _ in pages], content)
+    started = time.perf_counter()
+    quiz = model.generate(prompt)
+    return time.perf_counter() - started, estimate_tokens(prompt), quiz["questions"]
+
+
+def run_map_reduce(pages, model, num_questions, chunk_tokens, reducer):
+    started = time.perf_counter()
+    chunks = chunk_pages(pages, chunk_tokens)
+    shares = allocate(num_questions, [c.tokens for c in chunks])
+    prompts = [prompt_for(max(1, s + 1), c.page_numbers, c.text) for c, s in zip(chunks, shares)]
+    results = reducer.map(prompts, model.generate)
+    quiz = merge_quiz(results, [c.tokens for c in chunks], num_questions)
+    elapsed = time.perf_counter() - started
+    return elapsed, chunks, sum(estimate_tokens(p) for p in prompts), quiz["questions"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", nargs="+", type=int, default=[5, 20, 50])
+    ap.add_argument("--words-per-page", type=int, default=450)
+    ap.add_argument("--questions", type=int, default=10)
+    ap.add_argument("--chunk-tokens", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--base-ms", type=float, default=400)
+    ap.add_argument("--in-ms-per-1k", type=float, default=60)
+    ap.add_argument("--out-ms-per-question", type=float, default=150)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    model = FakeModel(args.base_ms, args.in_ms_per_1k, args.out_ms_per_question)
+    reducer = MapReducer(workers=args.workers)
+    rows = []
+    print(
+        f"questions={args.questions} chunk-tokens={args.chunk_tokens} workers={args.workers} "
+        f"words/page={args.words_per_page}"
+    )
+    print(f"{'pages':>5} {'chunks':>6} {'max chunk tok':>13} {'single tok':>10} {'map tok':>8} "
+          f"{'single s':>8} {'map s':>7} {'speedup':>7} {'unique':>6}")
+    for count in args.pages:
+        pages = make_pages(count, args.words_per_page)
+        single_s, single_tokens, _ = run_single(pages, model, args.questions)
+        map_s, chunks, map_tokens, questions = run_map_reduce(
+            pages, model, args.questions, args.chunk_tokens, reducer
+        )
+        row = {
+            "pages": count,
+            "chunks": len(chunks),
+            "chunkTokens": [c.tokens for c in chunks],
+            "singlePromptTokens": single_tokens,
+            "mapPromptTokens": map_tokens,
+            "singleSeconds": single_s,
+            "mapReduceSeconds": map_s,
+            "uniqueQuestions": len(questions),
+        }
+        rows.append(row)
+        print(
+            f"{count:>5} {len(chunks):>6} {max(row['chunkTokens']):>13} {single_tokens:>10} {map_tokens:>8} "
+            f"{single_s:>8.2f} {map_s:>7.2f} {single_s / map_s:>7.2f} {len(questions):>3}/{args.questions:<2}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
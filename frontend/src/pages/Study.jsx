@@ -119,23 +119,11 @@ export default function Study() {
     }
   }, [currentPage, conversationId]);
 
-  // Fetch PDF page image when page changes
+  // PDF page image: served as a cacheable binary, so the browser
+  // reuses it (ETag / Cache-Control) when revisiting a page
   useEffect(() => {
     if (!pdf_id || !currentPage) return;
-    const fetchPdfPageImage = async () => {
-      try {
-        const response = await fetch(
-          `${API_BASE_URL}/pdf/${pdf_id}/page/${currentPage}/image`
-        );
-        const data = await response.json();
-        if (response.ok && data.image) {
-          setPdfPageImage(data.image);
-        }
-      } catch (err) {
-        console.error("Error fetching PDF page image:", err);
-      }
-    };
-    fetchPdfPageImage();
+    setPdfPageImage(`${API_BASE_URL}/pdf/${pdf_id}/page/${currentPage}/image`);
   }, [pdf_id, currentPage]);
 
   // Handle Explain button click
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects items from many callers for up to max_wait_ms (or until
+    max_batch items are waiting) and runs them through run_batch(items) as
+    one batch on a single worker thread.
+
+    run_batch must return one result per item, in order; a result that is an
+    Exception is raised to that caller only.
+    """
+
+    def __init__(self, run_batch, max_batch=8, max_wait_ms=10, name="micro-batcher"):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}  # batch size -> count
+        self.total_wait = 0.0
+
+    # ======================================================
+    # 🔹 Worker
+    # ======================================================
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.total_wait += sum(started - queued_at for _, _, queued_at in batch)
+
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def submit(self, item):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return future
+
+    def map(self, items):
+        """Results for items in order; failures come back as Exception values."""
+        futures = [self.submit(item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queueDepth": self._queue.qsize(),
+                "maxQueueDepth": self.max_queue_depth,
+                "batches": self.batches,
+                "items": self.items,
+                "avgBatchSize": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "avgQueueWaitMs": round(1000 * self.total_wait / self.items, 2) if self.items else 0.0,
+                "batchSizeHistogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            }
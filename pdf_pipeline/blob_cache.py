@@ -0,0 +1,319 @@
+import os
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# ======================================================
+# 🔹 Cache Location / Limits
+# ======================================================
+CACHE_ROOT = os.environ.get(
+    "PDF_CACHE_DIR",
+    "/tmp/studymate_cache" if os.environ.get("RENDER") else "cache"
+)
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_MB", "1024")) * 1024 * 1024
+STALE_TMP_SECONDS = 3600
+
+
+class DiskLRUCache:
+    """
+    Size-capped on-disk cache with LRU eviction.
+
+    Files are filled atomically (write to a temp name, then os.replace), so a
+    reader never sees a half-written entry, even across gunicorn workers that
+    share the same directory.
+    """
+
+    def __init__(self, root, max_bytes, suffix=""):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_existing()
+
+    # ======================================================
+    # 🔹 Internals
+    # ======================================================
+    def _load_existing(self):
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith("."):
+                # Partial fill left behind by a crashed worker (recent ones may
+                # still be in flight in another process)
+                try:
+                    if time.time() - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = name[: len(name) - len(self.suffix)] if self.suffix else name
+            found.append((st.st_mtime, key, st.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}{self.suffix}")
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _touch(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self._total_bytes += size
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _record(self, key, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def get(self, key):
+        """Return the cached file path for key, or None. Counts a hit/miss."""
+        path = self._touch(key)
+        self._count(bool(path))
+        return path
+
+    def contains(self, key):
+        return os.path.exists(self._path(key))
+
+    def discard(self, key):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def put_bytes(self, key, data):
+        return self.fill(key, lambda tmp_path: _write_bytes(tmp_path, data))
+
+    def fill(self, key, writer):
+        """
+        Populate key by calling writer(tmp_path). The temp file is moved into
+        place only if the writer succeeds.
+        """
+        path = self._path(key)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._record(key, os.path.getsize(path))
+        return path
+
+    def get_or_fill(self, key, writer):
+        """
+        Cached path for key, calling writer(tmp_path) on a miss. Concurrent
+        callers for the same key wait for a single fill.
+        """
+        path = self._touch(key)
+        if path:
+            self._count(True)
+            return path
+
+        with self._key_lock(key):
+            path = self._touch(key)
+            self._count(bool(path))
+            return path or self.fill(key, writer)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PDFBlobCache:
+    """
+    Content-addressed PDF cache.
+
+    Blobs are stored once under their sha256 (blobs/<sha256>.pdf). Each pdf id
+    gets a tiny ref file (refs/<pdf_id>) holding the hash of its blob, so the
+    first request for a PDF downloads it and every later request - from any
+    worker - is a local file read.
+    """
+
+    def __init__(self, root=CACHE_ROOT, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.blobs = DiskLRUCache(os.path.join(root, "blobs"), max_bytes, suffix=".pdf")
+        self.refs_dir = os.path.join(root, "refs")
+        os.makedirs(self.refs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pdf_locks = {}
+
+    def _pdf_lock(self, pdf_id):
+        with self._lock:
+            lock = self._pdf_locks.get(pdf_id)
+            if lock is None:
+                lock = self._pdf_locks[pdf_id] = threading.Lock()
+            return lock
+
+    def _read_ref(self, pdf_id):
+        try:
+            with open(os.path.join(self.refs_dir, pdf_id), "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_ref(self, pdf_id, content_hash):
+        ref_path = os.path.join(self.refs_dir, pdf_id)
+        tmp_path = f"{ref_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content_hash)
+        os.replace(tmp_path, ref_path)
+
+    def get_path(self, pdf_id, url, download, content_hash=None):
+        """
+        Local path of the PDF, downloading it with download(url, dest_path)
+        only when no cached blob exists for this pdf id / content hash.
+        """
+        pdf_id = str(pdf_id)
+        content_hash = content_hash or self._read_ref(pdf_id)
+        path = self.blobs._touch(content_hash) if content_hash else None
+        if path:
+            self.blobs._count(True)
+            return path
+
+        with self._pdf_lock(pdf_id):
+            # Another thread may have filled it while we waited
+            content_hash = content_hash or self._read_ref(pdf_id)
+            path = self.blobs._touch(content_hash) if content_hash else None
+            self.blobs._count(bool(path))
+            if path:
+                return path
+
+            tmp_path = os.path.join(self.blobs.root, f".{uuid.uuid4().hex}.download")
+            try:
+                download(url, tmp_path)
+                digest = sha256_file(tmp_path)
+                path = self.blobs._touch(digest)
+                if not path:
+                    path = self.blobs.fill(digest, lambda dest: os.replace(tmp_path, dest))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            self._write_ref(pdf_id, digest)
+            return path
+
+    def ingest_stream(self, stream, chunk_size=1024 * 1024):
+        """
+        Copy an upload stream into the cache while hashing it, without holding
+        the whole file in memory. Returns (sha256, local_path).
+        """
+        h = hashlib.sha256()
+        tmp_path = os.path.join(self.blobs.root, f".{uuid.uuid4().hex}.upload")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+            digest = h.hexdigest()
+            path = self.blobs._touch(digest)
+            if not path:
+                path = self.blobs.fill(digest, lambda dest: os.replace(tmp_path, dest))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest, path
+
+    def link(self, pdf_id, content_hash):
+        self._write_ref(str(pdf_id), content_hash)
+
+    def discard(self, content_hash):
+        self.blobs.discard(content_hash)
+
+    @staticmethod
+    def content_hash_of(path):
+        return os.path.basename(path)[: -len(".pdf")]
+
+    def stats(self):
+        return self.blobs.stats()
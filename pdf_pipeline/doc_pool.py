@@ -0,0 +1,154 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+
+# ======================================================
+# 🔹 Pool Limits
+# ======================================================
+DOC_POOL_MAX_DOCS = int(os.environ.get("DOC_POOL_MAX_DOCS", "8"))
+# Budget covers the PDF bytes we hold AND MuPDF's own object store
+DOC_POOL_MAX_BYTES = int(os.environ.get("DOC_POOL_MAX_MB", "256")) * 1024 * 1024
+
+
+def _mupdf_store_size():
+    # A property on older PyMuPDF releases, a method on newer ones
+    size = fitz.TOOLS.store_size
+    if callable(size):
+        size = size()
+    return size or 0
+
+
+class _PooledDoc:
+    __slots__ = ("doc", "size", "lock", "borrowers", "evicted")
+
+    def __init__(self, doc, size):
+        self.doc = doc
+        self.size = size
+        self.lock = threading.Lock()
+        self.borrowers = 0
+        self.evicted = False
+
+
+class DocumentPool:
+    """
+    Bounded LRU pool of open fitz.Document handles, opened from memory with
+    fitz.open(stream=...). Parsing and rendering the same PDF reuse one handle
+    instead of paying the open/xref cost on every request.
+
+    A handle is used by one thread at a time (MuPDF documents are not
+    thread-safe); evicted handles are closed once their last borrower is done.
+    """
+
+    def __init__(self, max_docs=DOC_POOL_MAX_DOCS, max_bytes=DOC_POOL_MAX_BYTES):
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._open_locks = {}
+        self._entries = OrderedDict()  # key -> _PooledDoc, oldest first
+        self._held_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ======================================================
+    # 🔹 Internals
+    # ======================================================
+    def _open_lock(self, key):
+        with self._lock:
+            lock = self._open_locks.get(key)
+            if lock is None:
+                lock = self._open_locks[key] = threading.Lock()
+            return lock
+
+    def _acquire(self, key, load_bytes):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                entry.borrowers += 1
+                self.hits += 1
+                return entry
+
+        with self._open_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry:
+                    self._entries.move_to_end(key)
+                    entry.borrowers += 1
+                    self.hits += 1
+                    return entry
+
+            data = load_bytes()
+            doc = fitz.open(stream=data, filetype="pdf")
+            entry = _PooledDoc(doc, len(data))
+            entry.borrowers = 1
+
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._held_bytes += entry.size
+        self._enforce_budget()
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.borrowers -= 1
+            close_now = entry.evicted and entry.borrowers == 0
+        if close_now:
+            entry.doc.close()
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        # MuPDF caches decoded objects (fonts, images) in a global store; let it
+        # give memory back first before dropping whole documents.
+        if self._held_bytes + _mupdf_store_size() > self.max_bytes:
+            fitz.TOOLS.store_shrink(50)
+
+        to_close = []
+        with self._lock:
+            for key in list(self._entries):
+                over_count = len(self._entries) > self.max_docs
+                over_bytes = self._held_bytes + _mupdf_store_size() > self.max_bytes
+                if not (over_count or over_bytes) or len(self._entries) <= 1:
+                    break
+                entry = self._entries.pop(key)
+                self._held_bytes -= entry.size
+                self.evictions += 1
+                entry.evicted = True
+                if entry.borrowers == 0:
+                    to_close.append(entry)
+
+        for entry in to_close:
+            entry.doc.close()
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    @contextmanager
+    def borrow(self, key, load_bytes):
+        """
+        Borrow the open document for key, calling load_bytes() to get the PDF
+        bytes only when it is not pooled yet.
+        """
+        entry = self._acquire(key, load_bytes)
+        try:
+            with entry.lock:
+                yield entry.doc
+        finally:
+            self._release(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "openDocs": len(self._entries),
+                "heldBytes": self._held_bytes,
+                "mupdfStoreBytes": _mupdf_store_size(),
+                "maxBytes": self.max_bytes,
+                "maxDocs": self.max_docs,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,204 @@
+import os
+import bisect
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ======================================================
+# 🔹 Fetch Limits
+# ======================================================
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+PDF_MAX_DOWNLOAD_BYTES = int(os.environ.get("PDF_MAX_DOWNLOAD_MB", "100")) * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+# Latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class FetchTooLarge(Exception):
+    pass
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot = overflow
+        self.total = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.total += 1
+            self.sum_ms += ms
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"<={b}ms" for b in self.buckets] + [f">{self.buckets[-1]}ms"]
+            return {
+                "count": self.total,
+                "avgMs": round(self.sum_ms / self.total, 2) if self.total else 0.0,
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class HTTPFetcher:
+    """
+    Shared keep-alive session for Cloudinary fetches: pooled connections,
+    retry with exponential backoff, chunked streaming to disk with a size
+    guard, and Range requests for partial reads.
+    """
+
+    def __init__(
+        self,
+        pool_size=HTTP_POOL_SIZE,
+        retries=HTTP_RETRIES,
+        backoff=HTTP_BACKOFF,
+        timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        max_bytes=PDF_MAX_DOWNLOAD_BYTES,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.latency = {
+            "download": LatencyHistogram(),
+            "range": LatencyHistogram(),
+        }
+        self.errors = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    # ======================================================
+    # 🔹 Full Download (streamed, resumable)
+    # ======================================================
+    def download(self, url, dest_path, max_bytes=None):
+        """
+        Stream url into dest_path. A connection that drops mid-body is resumed
+        with a Range request from the last byte written.
+        """
+        max_bytes = max_bytes or self.max_bytes
+        started = time.perf_counter()
+        written = 0
+        try:
+            with open(dest_path, "wb") as f:
+                for attempt in range(self.retries + 1):
+                    headers = {"Range": f"bytes={written}-"} if written else {}
+                    try:
+                        with self.session.get(
+                            url, stream=True, timeout=self.timeout, headers=headers
+                        ) as r:
+                            r.raise_for_status()
+                            if written and r.status_code != 206:
+                                # Server ignored the Range header: start over
+                                f.seek(0)
+                                f.truncate()
+                                written = 0
+
+                            length = r.headers.get("Content-Length")
+                            if length and written + int(length) > max_bytes:
+                                raise FetchTooLarge(f"PDF larger than {max_bytes} bytes")
+
+                            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                                written += len(chunk)
+                                if written > max_bytes:
+                                    raise FetchTooLarge(f"PDF larger than {max_bytes} bytes")
+                                f.write(chunk)
+                        break
+                    except (
+                        requests.ConnectionError,
+                        requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError,
+                    ):
+                        if attempt == self.retries:
+                            raise
+                        time.sleep(self.backoff * (2 ** attempt))
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+        self.latency["download"].observe((time.perf_counter() - started) * 1000)
+        with self._lock:
+            self.bytes_downloaded += written
+        return written
+
+    # ======================================================
+    # 🔹 Partial Reads
+    # ======================================================
+    def fetch_range(self, url, start, end=None):
+        """
+        Bytes [start, end] of url (end inclusive, None = to the end). A
+        negative start with no end reads the last -start bytes.
+        """
+        if start < 0:
+            range_header = f"bytes={start}"
+        else:
+            range_header = f"bytes={start}-{'' if end is None else end}"
+
+        started = time.perf_counter()
+        try:
+            with self.session.get(
+                url, stream=True, timeout=self.timeout, headers={"Range": range_header}
+            ) as r:
+                r.raise_for_status()
+                if r.status_code == 206:
+                    data = r.content
+                else:
+                    # No Range support: read only as far as we need
+                    limit = None if start < 0 or end is None else end + 1
+                    buf = bytearray()
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        buf += chunk
+                        if limit is not None and len(buf) >= limit:
+                            break
+                        if len(buf) > self.max_bytes:
+                            raise FetchTooLarge(f"PDF larger than {self.max_bytes} bytes")
+                    data = bytes(buf[start:] if start < 0 else buf[start:limit])
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+        self.latency["range"].observe((time.perf_counter() - started) * 1000)
+        with self._lock:
+            self.bytes_downloaded += len(data)
+        return data
+
+    def fetch_head_bytes(self, url, nbytes=1024):
+        return self.fetch_range(url, 0, nbytes - 1)
+
+    def fetch_tail_bytes(self, url, nbytes=1024):
+        return self.fetch_range(url, -nbytes)
+
+    def stats(self):
+        with self._lock:
+            totals = {"errors": self.errors, "bytesDownloaded": self.bytes_downloaded}
+        return {
+            **totals,
+            "latency": {name: h.snapshot() for name, h in self.latency.items()},
+        }
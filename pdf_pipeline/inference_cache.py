@@ -0,0 +1,155 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+
+from pdf_pipeline.blob_cache import CACHE_ROOT
+
+# ======================================================
+# 🔹 Cache Location / Limits
+# ======================================================
+INFERENCE_CACHE_PATH = os.environ.get(
+    "INFERENCE_CACHE_PATH", os.path.join(CACHE_ROOT, "inference.sqlite3")
+)
+INFERENCE_CACHE_MAX_BYTES = int(os.environ.get("INFERENCE_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Evict down to this fraction of the budget so we don't evict on every put
+EVICT_TO_FRACTION = 0.9
+# A hit only rewrites last_used when it is older than this: LRU order to
+# within a few minutes, without a write per lookup
+TOUCH_INTERVAL_SECONDS = 300
+
+
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class InferenceCache:
+    """
+    Persistent cache of OCR text and BLIP captions, keyed by the sha256 of
+    the embedded image bytes plus a kind/version string (e.g. the Tesseract
+    config or the BLIP model name), so repeated logos, headers and icons are
+    only run through the models once. Changing a version string makes the old
+    entries unreachable; they age out through LRU eviction.
+
+    Backed by SQLite, so entries survive restarts and are shared by every
+    worker process using the same file.
+    """
+
+    def __init__(self, path=INFERENCE_CACHE_PATH, max_bytes=INFERENCE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit; writes take BEGIN IMMEDIATE themselves so the byte
+        # total stays right with several processes on one file
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        # Running total of results.size, so puts don't SUM the whole table
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value)"
+            " SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM results"
+        )
+
+    # ======================================================
+    # 🔹 Internals
+    # ======================================================
+    @staticmethod
+    def _key(kind, version, digest):
+        return f"{kind}:{version}:{digest}"
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _add_bytes(self, delta):
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+
+    def _evict(self):
+        # Caller holds self._lock, inside a write transaction
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO_FRACTION
+        doomed = []
+        freed = 0
+        # Oldest first, read only as far as needed
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            if total - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        self._add_bytes(-freed)
+        self.evictions += len(doomed)
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def get(self, kind, version, digest):
+        """Cached value, or None on a miss."""
+        key = self._key(kind, version, digest)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, last_used FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_INTERVAL_SECONDS:
+                self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, kind, version, digest, value):
+        key = self._key(kind, version, digest)
+        size = len(key) + len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time()),
+                )
+                self._add_bytes(size - (old[0] if old else 0))
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            total = self._total_bytes()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "totalBytes": total,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+def make_inference_cache():
+    """An InferenceCache, or None when INFERENCE_CACHE_MAX_MB=0 (disabled)."""
+    return InferenceCache() if INFERENCE_CACHE_MAX_BYTES > 0 else None
@@ -0,0 +1,296 @@
+import os
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+# ======================================================
+# 🔹 Job Settings
+# ======================================================
+PARSE_JOB_WORKERS = int(os.environ.get("PARSE_JOB_WORKERS", "2"))
+PARSE_JOB_LEASE_SECONDS = int(os.environ.get("PARSE_JOB_LEASE_SECONDS", "300"))
+# How long a page keeps retrying a transient error (parser busy) before the
+# job is handed back to the sweeper
+PARSE_JOB_RETRY_SECONDS = float(os.environ.get("PARSE_JOB_RETRY_SECONDS", "60"))
+RETRY_BACKOFF_SECONDS = (1, 2, 5, 10)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class ParseJobRunner:
+    """
+    Durable whole-document parse jobs.
+
+    Job state lives in the `parse_jobs` collection with a per-page status map,
+    so a job that dies mid-way (crash, redeploy) is picked up again once its
+    lease expires and continues with the pages that are not done yet.
+
+    open_document(pdf_entry) returns an open fitz.Document (owned by the job),
+    and parse_page(pdf_entry, doc, page_no, language) parses and stores one
+    page.
+
+    A page that raises one of transient_errors (e.g. the parser pool is at
+    capacity) is retried with backoff for up to retry_seconds. If it still
+    fails, the page stays pending and the job goes back to "queued" for the
+    sweeper to resume later, instead of ending as "failed".
+    """
+
+    def __init__(self, db, open_document, parse_page, workers=PARSE_JOB_WORKERS,
+                 lease_seconds=PARSE_JOB_LEASE_SECONDS, transient_errors=(),
+                 retry_seconds=PARSE_JOB_RETRY_SECONDS):
+        self.db = db
+        self.open_document = open_document
+        self.parse_page = parse_page
+        self.lease_seconds = lease_seconds
+        self.transient_errors = tuple(transient_errors)
+        # Retrying must not outlast the lease, or another worker takes the job
+        self.retry_seconds = min(retry_seconds, lease_seconds / 2)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse-job")
+
+        threading.Thread(target=self._sweep_forever, name="parse-job-sweeper", daemon=True).start()
+
+    # ======================================================
+    # 🔹 Create / Read
+    # ======================================================
+    def create_job(self, pdf_entry, page_numbers, language, user_id=None):
+        now = _now()
+        job = {
+            "pdfId": pdf_entry["_id"],
+            "ownerUserId": user_id,
+            "language": language,
+            "pageNumbers": page_numbers,
+            "pageStatus": {str(n): PENDING for n in page_numbers},
+            "pageErrors": {},
+            "doneCount": 0,
+            "failedCount": 0,
+            "status": "queued",
+            "createdAt": now,
+            "updatedAt": now,
+            "startedAt": None,
+            "finishedAt": None,
+            "leaseOwner": None,
+            "leaseExpiresAt": None,
+        }
+        job["_id"] = self.db.parse_jobs.insert_one(job).inserted_id
+        self.submit(job["_id"])
+        return job
+
+    def submit(self, job_id):
+        self._executor.submit(self._run, job_id)
+
+    @staticmethod
+    def progress(job):
+        """JSON-friendly progress view with throughput and ETA."""
+        total = len(job.get("pageNumbers", []))
+        done = job.get("doneCount", 0)
+        failed = job.get("failedCount", 0)
+        remaining = max(0, total - done - failed)
+
+        throughput = None
+        eta_seconds = None
+        run_started = job.get("runStartedAt")
+        if run_started and job.get("status") == "running":
+            if run_started.tzinfo is None:
+                run_started = run_started.replace(tzinfo=timezone.utc)
+            elapsed = (_now() - run_started).total_seconds()
+            processed = done + failed - job.get("runProcessedAtStart", 0)
+            if elapsed > 0 and processed > 0:
+                throughput = processed / elapsed
+                eta_seconds = round(remaining / throughput, 1)
+
+        def _iso(value):
+            return value.isoformat() if value else None
+
+        return {
+            "job_id": str(job["_id"]),
+            "pdf_id": str(job["pdfId"]),
+            "status": job.get("status"),
+            "language": job.get("language"),
+            "totalPages": total,
+            "donePages": done,
+            "failedPages": failed,
+            "remainingPages": remaining,
+            "percent": round(100 * (done + failed) / total, 1) if total else 100.0,
+            "pagesPerMinute": round(throughput * 60, 2) if throughput else None,
+            "etaSeconds": eta_seconds,
+            "pageStatus": job.get("pageStatus", {}),
+            "pageErrors": job.get("pageErrors", {}),
+            "createdAt": _iso(job.get("createdAt")),
+            "startedAt": _iso(job.get("startedAt")),
+            "finishedAt": _iso(job.get("finishedAt")),
+        }
+
+    # ======================================================
+    # 🔹 Worker
+    # ======================================================
+    def _claim(self, job_id):
+        now = _now()
+        job = self.db.parse_jobs.find_one({"_id": job_id}, {"doneCount": 1, "failedCount": 1})
+        if not job:
+            return None
+        claimed = self.db.parse_jobs.find_one_and_update(
+            {
+                "_id": job_id,
+                "status": {"$in": list(ACTIVE_STATUSES)},
+                "$or": [
+                    {"leaseExpiresAt": None},
+                    {"leaseExpiresAt": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "leaseOwner": self.worker_id,
+                    "leaseExpiresAt": now + timedelta(seconds=self.lease_seconds),
+                    "runStartedAt": now,
+                    "runProcessedAtStart": job.get("doneCount", 0) + job.get("failedCount", 0),
+                    "updatedAt": now,
+                },
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if claimed and not claimed.get("startedAt"):
+            claimed["startedAt"] = now
+            self.db.parse_jobs.update_one({"_id": job_id}, {"$set": {"startedAt": now}})
+        return claimed
+
+    def _mark_page(self, job_id, page_no, status, previous=PENDING, error=None):
+        now = _now()
+        update = {
+            "$set": {
+                f"pageStatus.{page_no}": status,
+                "updatedAt": now,
+                "leaseExpiresAt": now + timedelta(seconds=self.lease_seconds),
+            },
+        }
+        # A page retried after a crash may move failed -> done (or back to
+        # pending when the retry hit a transient error)
+        inc = {}
+        if status != previous:
+            if status != PENDING:
+                inc["doneCount" if status == DONE else "failedCount"] = 1
+            if previous == FAILED:
+                inc["failedCount"] = inc.get("failedCount", 0) - 1
+        if inc:
+            update["$inc"] = inc
+        if error:
+            update["$set"][f"pageErrors.{page_no}"] = error
+        else:
+            update["$unset"] = {f"pageErrors.{page_no}": ""}
+        self.db.parse_jobs.update_one({"_id": job_id, "leaseOwner": self.worker_id}, update)
+
+    def _finish(self, job_id, status):
+        now = _now()
+        self.db.parse_jobs.update_one(
+            {"_id": job_id, "leaseOwner": self.worker_id},
+            {"$set": {
+                "status": status,
+                "finishedAt": now,
+                "updatedAt": now,
+                "leaseOwner": None,
+                "leaseExpiresAt": None,
+            }},
+        )
+
+    def _release(self, job_id):
+        # Back in the queue, unleased: the next sweep resumes it
+        self.db.parse_jobs.update_one(
+            {"_id": job_id, "leaseOwner": self.worker_id},
+            {"$set": {
+                "status": "queued",
+                "updatedAt": _now(),
+                "leaseOwner": None,
+                "leaseExpiresAt": None,
+            }},
+        )
+
+    def _parse_with_retry(self, pdf_entry, doc, page_no, language):
+        """parse_page, retrying transient errors with backoff; re-raises the last one."""
+        deadline = time.monotonic() + self.retry_seconds
+        for attempt in itertools.count():
+            try:
+                return self.parse_page(pdf_entry, doc, page_no, language)
+            except self.transient_errors:
+                delay = RETRY_BACKOFF_SECONDS[min(attempt, len(RETRY_BACKOFF_SECONDS) - 1)]
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+
+    def _run(self, job_id):
+        try:
+            job = self._claim(job_id)
+            if not job:
+                return  # finished, or another worker holds the lease
+
+            pdf_entry = self.db.pdfs.find_one({"_id": job["pdfId"]})
+            if not pdf_entry:
+                self._finish(job_id, "failed")
+                return
+
+            pending = [
+                n for n in job["pageNumbers"]
+                if job["pageStatus"].get(str(n)) != DONE
+            ]
+            deferred = False
+            if pending:
+                doc = self.open_document(pdf_entry)
+                try:
+                    for page_no in pending:
+                        previous = job["pageStatus"].get(str(page_no), PENDING)
+                        try:
+                            self._parse_with_retry(pdf_entry, doc, page_no, job["language"])
+                            self._mark_page(job_id, page_no, DONE, previous)
+                        except self.transient_errors as e:
+                            # Still busy: leave the rest for a later sweep
+                            self._mark_page(job_id, page_no, PENDING, previous, str(e))
+                            deferred = True
+                            break
+                        except Exception as e:
+                            self._mark_page(job_id, page_no, FAILED, previous, str(e))
+                finally:
+                    doc.close()
+
+            if deferred:
+                self._release(job_id)
+                return
+
+            job = self.db.parse_jobs.find_one({"_id": job_id}, {"failedCount": 1})
+            self._finish(job_id, "failed" if job and job.get("failedCount") else "completed")
+        except Exception as e:
+            print(f"Parse job {job_id} crashed: {e}")
+
+    # ======================================================
+    # 🔹 Resume After Crash
+    # ======================================================
+    def resume_pending(self):
+        now = _now()
+        cursor = self.db.parse_jobs.find(
+            {
+                "status": {"$in": list(ACTIVE_STATUSES)},
+                "$or": [{"leaseExpiresAt": None}, {"leaseExpiresAt": {"$lt": now}}],
+            },
+            {"_id": 1},
+        )
+        for job in cursor:
+            self.submit(job["_id"])
+
+    def _sweep_forever(self):
+        while True:
+            try:
+                self.resume_pending()
+            except Exception as e:
+                print(f"Parse job sweep failed: {e}")
+            time.sleep(self.lease_seconds)
@@ -0,0 +1,196 @@
+import re
+
+# ======================================================
+# 🔹 Block Kinds
+# ======================================================
+TEXT = "text"
+HEADING = "heading"
+CAPTION = "caption"
+EQUATION = "equation"
+IMAGE = "image"
+
+LAYOUT_VERSION = 1
+LAYOUT_FIELDS = ["kind", "x0", "y0", "x1", "y1", "fontSize", "text"]
+
+# Headings: noticeably larger than the page's body text, and short
+HEADING_SIZE_RATIO = 1.2
+HEADING_MAX_CHARS = 200
+# Text this close (pt) above/below an image, in a smaller font, is its caption
+CAPTION_MAX_GAP = 40
+CAPTION_RE = re.compile(r"^\s*(fig(ure)?|table|chart|diagram|plate)\.?\s*[\dIVX]", re.IGNORECASE)
+MATH_FONT_RE = re.compile(r"math|cmmi|cmsy|cmex|msbm|symbol|stix|cambria math", re.IGNORECASE)
+
+
+class Block:
+    __slots__ = ("kind", "bbox", "font_size", "text", "math_chars", "raw")
+
+    def __init__(self, kind, bbox, font_size=0.0, text="", math_chars=0, raw=None):
+        self.kind = kind
+        self.bbox = bbox  # (x0, y0, x1, y1) in PDF points
+        self.font_size = font_size
+        self.text = text
+        self.math_chars = math_chars
+        self.raw = raw  # PyMuPDF block dict, only while extracting images
+
+    def to_row(self):
+        x0, y0, x1, y1 = (round(v, 1) for v in self.bbox)
+        return [self.kind, x0, y0, x1, y1, round(self.font_size, 1), self.text]
+
+
+class PageLayout:
+    """
+    Blocks of one page in reading order, with their kind, bbox and font size.
+    Stored in compact row form (see to_dict) next to the page's flat text.
+    """
+    __slots__ = ("width", "height", "columns", "blocks", "scanned")
+
+    def __init__(self, width, height, columns, blocks, scanned=False):
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.blocks = blocks
+        self.scanned = scanned  # text came from a full-page OCR pass
+
+    def flat_text(self):
+        return "\n".join(b.text for b in self.blocks if b.text).strip()
+
+    def to_dict(self):
+        return {
+            "version": LAYOUT_VERSION,
+            "width": round(self.width, 1),
+            "height": round(self.height, 1),
+            "columns": self.columns,
+            "scanned": self.scanned,
+            "fields": LAYOUT_FIELDS,
+            "blocks": [b.to_row() for b in self.blocks],
+        }
+
+
+# ======================================================
+# 🔹 Building Blocks
+# ======================================================
+def _text_block(block):
+    lines = []
+    size_chars = {}  # font size -> characters set in it
+    math_chars = 0
+    for line in block.get("lines", []):
+        parts = []
+        for span in line.get("spans", []):
+            text = span.get("text", "")
+            parts.append(text)
+            size = round(span.get("size", 0.0), 1)
+            size_chars[size] = size_chars.get(size, 0) + len(text)
+            if MATH_FONT_RE.search(span.get("font", "")):
+                math_chars += len(text)
+        lines.append("".join(parts))
+
+    text = " ".join(line.strip() for line in lines if line.strip())
+    font_size = max(size_chars, key=size_chars.get) if size_chars else 0.0
+    return Block(TEXT, tuple(block["bbox"]), font_size, text, math_chars)
+
+
+def _body_font_size(blocks):
+    size_chars = {}
+    for b in blocks:
+        if b.kind == TEXT:
+            size_chars[b.font_size] = size_chars.get(b.font_size, 0) + len(b.text)
+    return max(size_chars, key=size_chars.get) if size_chars else 0.0
+
+
+def _near_image(block, images):
+    x0, y0, x1, y1 = block.bbox
+    for image in images:
+        ix0, iy0, ix1, iy1 = image.bbox
+        overlaps = x0 < ix1 and ix0 < x1
+        gap = min(abs(y0 - iy1), abs(iy0 - y1))
+        if overlaps and gap <= CAPTION_MAX_GAP:
+            return True
+    return False
+
+
+def _classify(blocks):
+    body = _body_font_size(blocks)
+    images = [b for b in blocks if b.kind == IMAGE]
+    for b in blocks:
+        if b.kind != TEXT or not b.text:
+            continue
+        if b.math_chars * 2 > len(b.text):
+            b.kind = EQUATION
+        elif CAPTION_RE.match(b.text) or (
+            images and b.font_size < body and _near_image(b, images)
+        ):
+            b.kind = CAPTION
+        elif body and b.font_size >= body * HEADING_SIZE_RATIO and len(b.text) <= HEADING_MAX_CHARS:
+            b.kind = HEADING
+
+
+# ======================================================
+# 🔹 Reading Order
+# ======================================================
+def _reading_order(blocks, page_width):
+    """
+    Top-to-bottom, but on two-column pages the left column of each band is
+    read before the right one. Bands are separated by full-width blocks
+    (titles, wide figures) that cross the middle of the page.
+    """
+    mid = page_width / 2
+    gutter = page_width * 0.04
+
+    def side(b):
+        if b.bbox[2] <= mid + gutter:
+            return 0
+        if b.bbox[0] >= mid - gutter:
+            return 1
+        return None  # spans both columns
+
+    by_position = sorted(blocks, key=lambda b: (b.bbox[1], b.bbox[0]))
+    left = sum(1 for b in blocks if side(b) == 0)
+    right = sum(1 for b in blocks if side(b) == 1)
+    if left < 2 or right < 2:
+        return by_position, 1
+
+    ordered = []
+    band = []
+    for b in by_position:
+        if side(b) is None:
+            ordered.extend(sorted(band, key=lambda b: (side(b), b.bbox[1], b.bbox[0])))
+            band = []
+            ordered.append(b)
+        else:
+            band.append(b)
+    ordered.extend(sorted(band, key=lambda b: (side(b), b.bbox[1], b.bbox[0])))
+    return ordered, 2
+
+
+def build_page_layout(page_dict):
+    """PageLayout from page.get_text("dict"), blocks in reading order."""
+    blocks = []
+    for block in page_dict.get("blocks", []):
+        if block.get("type") == 0:
+            text_block = _text_block(block)
+            if text_block.text:
+                blocks.append(text_block)
+        elif block.get("type") == 1:
+            blocks.append(Block(IMAGE, tuple(block["bbox"]), raw=block))
+
+    return _layout(blocks, page_dict.get("width", 0.0), page_dict.get("height", 0.0))
+
+
+def build_ocr_layout(ocr_blocks, scale, width, height):
+    """
+    PageLayout of a scanned page from OCRBackend.image_to_blocks() output.
+    scale maps render pixels to PDF points; the OCR line height stands in for
+    the font size.
+    """
+    blocks = [
+        Block(TEXT, (x0 * scale, y0 * scale, x1 * scale, y1 * scale), float(round(line_height * scale)), text)
+        for x0, y0, x1, y1, text, line_height in ocr_blocks
+        if text.strip()
+    ]
+    return _layout(blocks, width, height, scanned=True)
+
+
+def _layout(blocks, width, height, scanned=False):
+    _classify(blocks)
+    ordered, columns = _reading_order(blocks, width)
+    return PageLayout(width, height, columns, ordered, scanned)
@@ -0,0 +1,175 @@
+import os
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# ======================================================
+# 🔹 Cache Settings
+# ======================================================
+LLM_CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "256"))
+
+
+def normalize_text(text):
+    # Re-extractions of the same page differ only in whitespace
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def text_digest(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("response", "tokens", "seconds", "expires_at")
+
+    def __init__(self, response, tokens, seconds, expires_at):
+        self.response = response
+        self.tokens = tokens
+        self.seconds = seconds
+        self.expires_at = expires_at  # epoch seconds
+
+
+class LLMResponseCache:
+    """
+    Cache of LLM responses keyed by (normalized input text hash, language,
+    prompt version, model), so the same page text is only sent to the model
+    once, whichever upload or edition of a PDF it comes from.
+
+    Entries live in a Mongo collection with a TTL index (shared by every
+    worker, survive restarts) behind a small in-process LRU. Bump the prompt
+    version when a prompt changes; invalidate() drops the old entries.
+
+    Each entry remembers the tokens and seconds the original call cost, so
+    stats() can report what the hits saved.
+    """
+
+    def __init__(self, collection, ttl_days=LLM_CACHE_TTL_DAYS, memory_entries=LLM_CACHE_MEMORY_ENTRIES):
+        self.collection = collection
+        self.ttl = timedelta(days=ttl_days)
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> _Entry, oldest first
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.saved_seconds = 0.0
+        self._ensure_indexes()
+
+    # ======================================================
+    # 🔹 Internals
+    # ======================================================
+    def _ensure_indexes(self):
+        try:
+            self.collection.create_index("expiresAt", expireAfterSeconds=0)
+            self.collection.create_index([("promptVersion", 1), ("model", 1)])
+        except Exception as e:
+            print(f"LLM cache index creation failed: {e}")
+
+    @staticmethod
+    def key(text, language, prompt_version, model):
+        return f"{model}:{prompt_version}:{language}:{text_digest(text)}"
+
+    def _remember(self, key, entry):
+        # Caller holds self._lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _count_hit(self, entry):
+        # Caller holds self._lock
+        self.saved_tokens += entry.tokens
+        self.saved_seconds += entry.seconds
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def get(self, key):
+        """Cached response text, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self._count_hit(entry)
+                return entry.response
+            self._memory.pop(key, None)
+
+        doc = self.collection.find_one({"_id": key})
+        # The TTL monitor only runs once a minute, so check expiry here too
+        expires_at = doc and doc["expiresAt"]
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        with self._lock:
+            if not doc or expires_at.timestamp() <= now:
+                self.misses += 1
+                return None
+            entry = _Entry(doc["response"], doc.get("tokens", 0), doc.get("seconds", 0.0), expires_at.timestamp())
+            self._remember(key, entry)
+            self.store_hits += 1
+            self._count_hit(entry)
+            return entry.response
+
+    def put(self, key, response, prompt_version, model, tokens=0, seconds=0.0):
+        """Store a response with what it cost to generate (total tokens, wall seconds)."""
+        now = datetime.now(timezone.utc)
+        expires_at = now + self.ttl
+        self.collection.replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "response": response,
+                "promptVersion": prompt_version,
+                "model": model,
+                "tokens": tokens,
+                "seconds": round(seconds, 3),
+                "createdAt": now,
+                "expiresAt": expires_at,
+            },
+            upsert=True,
+        )
+        with self._lock:
+            self._remember(key, _Entry(response, tokens, seconds, expires_at.timestamp()))
+
+    def invalidate(self, prompt_version=None, model=None, keep=False):
+        """
+        Drop entries for this prompt version / model (both None: everything).
+        keep=True inverts it: drop everything that is NOT this version/model,
+        i.e. the leftovers from earlier prompts. Returns how many were removed.
+        """
+        query = {}
+        if prompt_version is not None:
+            query["promptVersion"] = {"$ne": prompt_version} if keep else prompt_version
+        if model is not None:
+            query["model"] = {"$ne": model} if keep else model
+        if keep and len(query) == 2:
+            query = {"$or": [{"promptVersion": query["promptVersion"]}, {"model": query["model"]}]}
+        removed = self.collection.delete_many(query).deleted_count
+        with self._lock:
+            self._memory.clear()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.store_hits
+            lookups = hits + self.misses
+            return {
+                "memoryEntries": len(self._memory),
+                "maxMemoryEntries": self.memory_entries,
+                "memoryHits": self.memory_hits,
+                "storeHits": self.store_hits,
+                "misses": self.misses,
+                "hitRate": round(hits / lookups, 3) if lookups else None,
+                "savedTokens": self.saved_tokens,
+                "savedSeconds": round(self.saved_seconds, 1),
+            }
+
+
+def make_llm_cache(collection):
+    """An LLMResponseCache on this collection, or None when LLM_CACHE_TTL_DAYS=0 (disabled)."""
+    return LLMResponseCache(collection) if LLM_CACHE_TTL_DAYS > 0 else None
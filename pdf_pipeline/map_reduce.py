@@ -0,0 +1,229 @@
+import os
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================================================
+# 🔹 Map-Reduce Settings
+# ======================================================
+# Page text per map prompt; selections that fit in one chunk use one prompt
+MAP_REDUCE_CHUNK_TOKENS = int(os.environ.get("MAP_REDUCE_CHUNK_TOKENS", "8000"))
+# Concurrent map calls per request
+MAP_REDUCE_WORKERS = int(os.environ.get("MAP_REDUCE_WORKERS", "4"))
+# Rough Gemini ratio for English/Hinglish text; only used for budgeting
+CHARS_PER_TOKEN = 4
+# Questions/cards this similar (word Jaccard) count as duplicates
+DUPLICATE_SIMILARITY = 0.8
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Chunk:
+    __slots__ = ("page_numbers", "text", "tokens")
+
+    def __init__(self, page_numbers, text, tokens):
+        self.page_numbers = page_numbers
+        self.text = text
+        self.tokens = tokens
+
+
+# ======================================================
+# 🔹 Map: Token-Budgeted Chunks
+# ======================================================
+def page_block(page_no, text, part=None):
+    label = f"PAGE {page_no}" if part is None else f"PAGE {page_no} (part {part})"
+    return f"\n\n--- {label} ---\n{text}\n"
+
+
+def chunk_pages(pages, max_tokens=MAP_REDUCE_CHUNK_TOKENS):
+    """
+    Packs (page_no, text) pairs, in order, into chunks of at most max_tokens
+    of page text. A page larger than the budget is split into parts of its
+    own (at whitespace where possible).
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    numbers, blocks, tokens = [], [], 0
+
+    def flush():
+        nonlocal numbers, blocks, tokens
+        if blocks:
+            chunks.append(Chunk(numbers, "".join(blocks), tokens))
+        numbers, blocks, tokens = [], [], 0
+
+    for page_no, text in pages:
+        block = page_block(page_no, text)
+        block_tokens = estimate_tokens(block)
+        if block_tokens > max_tokens:
+            flush()
+            part = 1
+            rest = text
+            # Leave room for the page label
+            part_chars = max(1, max_chars - len(page_block(page_no, "", 999)))
+            while rest:
+                cut = len(rest) if len(rest) <= part_chars else (rest.rfind(" ", 0, part_chars) + 1 or part_chars)
+                block = page_block(page_no, rest[:cut], part)
+                chunks.append(Chunk([page_no], block, estimate_tokens(block)))
+                rest = rest[cut:]
+                part += 1
+            continue
+        if tokens + block_tokens > max_tokens:
+            flush()
+        numbers.append(page_no)
+        blocks.append(block)
+        tokens += block_tokens
+    flush()
+    return chunks
+
+
+def allocate(total, weights):
+    """Split total into integer shares proportional to weights (largest remainder)."""
+    weight_sum = sum(weights) or 1
+    exact = [total * w / weight_sum for w in weights]
+    shares = [int(x) for x in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - shares[i], reverse=True)
+    for i in by_remainder[: total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+class MapReducer:
+    """
+    Runs one LLM call per chunk prompt on a bounded thread pool shared by
+    all requests, so a 50-page selection is several mid-sized prompts in
+    flight at once instead of one huge serial one. generate(prompt) returns
+    the parsed JSON of one call; failed chunks come back as Exception values,
+    in prompt order.
+    """
+
+    def __init__(self, workers=MAP_REDUCE_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map-reduce")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.chunks = 0
+        self.failed_chunks = 0
+        self.prompt_tokens = 0
+
+    def map(self, prompts, generate):
+        futures = [self._executor.submit(generate, prompt) for prompt in prompts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+
+        failed = sum(isinstance(r, Exception) for r in results)
+        with self._lock:
+            self.requests += 1
+            self.chunks += len(prompts)
+            self.failed_chunks += failed
+            self.prompt_tokens += sum(estimate_tokens(p) for p in prompts)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "requests": self.requests,
+                "chunks": self.chunks,
+                "failedChunks": self.failed_chunks,
+                "estimatedPromptTokens": self.prompt_tokens,
+            }
+
+
+# ======================================================
+# 🔹 Reduce: Merge + De-duplicate
+# ======================================================
+def _words(text):
+    return set(re.findall(r"\w+", str(text or "").lower()))
+
+
+class _Deduper:
+    """Exact (normalized) and near-duplicate (word Jaccard) detection."""
+
+    def __init__(self, threshold=DUPLICATE_SIMILARITY):
+        self.threshold = threshold
+        self.seen = []
+
+    def add(self, text):
+        """True if text is new (and remembers it), False for a duplicate."""
+        words = _words(text)
+        if not words:
+            return False
+        for other in self.seen:
+            if len(words & other) / len(words | other) >= self.threshold:
+                return False
+        self.seen.append(words)
+        return True
+
+
+def _dict_items(result, field):
+    if not isinstance(result, dict):
+        return []
+    items = result.get(field)
+    return items if isinstance(items, list) else []
+
+
+def merge_quiz(results, weights, num_questions):
+    """
+    Final quiz from per-chunk {"questions": [...]} results: each chunk
+    contributes its share (by weight) of num_questions, duplicates dropped,
+    then any shortfall is filled from the remaining questions round-robin.
+    """
+    per_chunk = [
+        [q for q in _dict_items(r, "questions") if isinstance(q, dict) and q.get("question") and q.get("options")]
+        for r in results
+    ]
+    quotas = allocate(num_questions, weights)
+    dedupe = _Deduper()
+    picked = []
+    leftovers = []
+    for questions, quota in zip(per_chunk, quotas):
+        taken = 0
+        rest = []
+        for q in questions:
+            if taken < quota and dedupe.add(q["question"]):
+                picked.append(q)
+                taken += 1
+            else:
+                rest.append(q)
+        leftovers.append(rest)
+
+    while len(picked) < num_questions and any(leftovers):
+        for rest in leftovers:
+            if rest and len(picked) < num_questions:
+                q = rest.pop(0)
+                if dedupe.add(q["question"]):
+                    picked.append(q)
+    return {"questions": picked}
+
+
+def merge_revision_packs(results):
+    """One revision pack from per-chunk packs, in page order, lists de-duplicated."""
+    packs = [r for r in results if isinstance(r, dict)]
+    merged = {
+        "title": next((p["title"] for p in packs if p.get("title")), None),
+        "notes_markdown": "\n\n".join(
+            p["notes_markdown"].strip() for p in packs if isinstance(p.get("notes_markdown"), str)
+        ),
+    }
+    list_fields = {
+        "key_terms": "term",
+        "flashcards": "front",
+        "exam_questions": "question",
+        "common_mistakes": None,  # plain strings
+    }
+    for field, text_key in list_fields.items():
+        dedupe = _Deduper()
+        merged[field] = [
+            item
+            for p in packs
+            for item in _dict_items(p, field)
+            if dedupe.add(item.get(text_key) if text_key and isinstance(item, dict) else item)
+        ]
+    return merged
@@ -0,0 +1,262 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import numpy as np
+
+# Optional imports
+try:
+    import pytesseract
+except:
+    pytesseract = None
+
+try:
+    import cv2
+except:
+    cv2 = None
+
+# ======================================================
+# 🔹 OCR Settings
+# ======================================================
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "tesseract")
+# Concurrent OCR calls per process (Tesseract runs as a subprocess per call).
+# The cap is per process, not per machine: by default the cores are split
+# between the WEB_CONCURRENCY gunicorn workers so they don't oversubscribe
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY") or 1))
+OCR_MAX_CONCURRENCY = int(
+    os.environ.get("OCR_MAX_CONCURRENCY") or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+)
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", "30"))
+TESSERACT_CONFIG = "--psm 6"
+# Full pages: automatic page segmentation, so columns/paragraphs come back as blocks
+TESSERACT_PAGE_CONFIG = "--psm 3"
+
+if pytesseract and os.name == "nt":
+    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+
+# ======================================================
+# 🔹 Backends
+# ======================================================
+class OCRBackend:
+    """
+    Interface for OCR engines; methods must be safe to call from several
+    threads at once. `version` goes into the OCR cache key, so change it
+    whenever the backend's output would change.
+
+    - image_to_text(image, timeout): text of an RGB PIL image
+    - image_to_blocks(image, timeout): layout OCR of a whole page, as a list
+      of (x0, y0, x1, y1, text, line_height) paragraphs in pixel coordinates
+    """
+    name = "none"
+    version = "none"
+
+    def available(self):
+        return False
+
+    def image_to_text(self, image, timeout=None):
+        raise NotImplementedError
+
+    def image_to_blocks(self, image, timeout=None):
+        raise NotImplementedError
+
+
+class TesseractBackend(OCRBackend):
+    """One tesseract subprocess per call (pytesseract); killed on timeout."""
+    name = "tesseract"
+
+    def __init__(self, config=TESSERACT_CONFIG):
+        self.config = config
+        self.version = f"tesseract:{config}"
+
+    def available(self):
+        return bool(pytesseract and cv2)
+
+    def image_to_text(self, image, timeout=None):
+        gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+        return pytesseract.image_to_string(gray, config=self.config, timeout=timeout or 0).strip()
+
+    def image_to_blocks(self, image, timeout=None):
+        gray = np.asarray(image.convert("L"))
+        data = pytesseract.image_to_data(
+            gray, config=TESSERACT_PAGE_CONFIG, timeout=timeout or 0,
+            output_type=pytesseract.Output.DICT,
+        )
+
+        # Words -> lines -> paragraphs, keeping Tesseract's order
+        paragraphs = {}  # (block, par) -> {line: [word boxes]}
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            key = (data["block_num"][i], data["par_num"][i])
+            box = (data["left"][i], data["top"][i], data["width"][i], data["height"][i], word)
+            paragraphs.setdefault(key, {}).setdefault(data["line_num"][i], []).append(box)
+
+        blocks = []
+        for lines in paragraphs.values():
+            boxes = [box for words in lines.values() for box in words]
+            x0 = min(b[0] for b in boxes)
+            y0 = min(b[1] for b in boxes)
+            x1 = max(b[0] + b[2] for b in boxes)
+            y1 = max(b[1] + b[3] for b in boxes)
+            text = " ".join(" ".join(b[4] for b in words) for words in lines.values())
+            line_height = sum(max(b[3] for b in words) for words in lines.values()) / len(lines)
+            blocks.append((x0, y0, x1, y1, text, line_height))
+        return blocks
+
+
+_BACKENDS = {"tesseract": TesseractBackend}
+
+
+def register_backend(name, factory):
+    """Make an OCRBackend factory selectable with OCR_BACKEND=<name>."""
+    _BACKENDS[name] = factory
+
+
+def make_backend(name=OCR_BACKEND):
+    factory = _BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown OCR backend: {name}")
+    return factory()
+
+
+# ======================================================
+# 🔹 Pool
+# ======================================================
+class OCRTimeout(Exception):
+    pass
+
+
+class _Started:
+    """Set by the pool thread when a queued OCR call actually begins."""
+    __slots__ = ("event", "at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+
+    def mark(self):
+        self.at = time.monotonic()
+        self.event.set()
+
+
+class OCRPool:
+    """
+    Fans OCR calls out over a bounded thread pool. The work is
+    subprocess-bound, so threads are enough, and max_workers is the
+    process-wide cap on concurrent OCR calls no matter how many pages are
+    being parsed at once.
+    """
+
+    def __init__(self, backend=None, max_workers=OCR_MAX_CONCURRENCY, timeout=OCR_TIMEOUT):
+        self.backend = backend or make_backend()
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+
+    def available(self):
+        return self.backend.available()
+
+    def resize(self, max_workers):
+        """New cap on concurrent OCR calls; calls already submitted finish on the old pool."""
+        old = self._executor
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+        old.shutdown(wait=False)
+
+    def _run(self, image, timeout, layout=False, started=None):
+        if started is not None:
+            started.mark()
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            if layout:
+                return self.backend.image_to_blocks(image, timeout=timeout)
+            return self.backend.image_to_text(image, timeout=timeout)
+        except RuntimeError as e:
+            # pytesseract reports a killed-on-timeout run as RuntimeError
+            if "timeout" in str(e).lower():
+                raise OCRTimeout(f"OCR took longer than {timeout}s") from e
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.total_seconds += time.perf_counter() - started
+
+    def _submit(self, image, timeout, layout=False):
+        started = _Started()
+        return self._executor.submit(self._run, image, timeout, layout, started), started
+
+    @staticmethod
+    def _result(future, started, timeout):
+        """
+        future.result() with a backstop for backends that don't enforce the
+        timeout themselves, counted from when the call starts: time queued
+        behind other pages' OCR doesn't count.
+        """
+        # A queued call always starts eventually (or the future fails)
+        while not started.event.wait(0.5):
+            if future.done():
+                break
+        if started.at is None:
+            return future.result()
+        return future.result(timeout=max(0.0, started.at + timeout + 5 - time.monotonic()))
+
+    def map(self, images):
+        """OCR text for each image, in order; failures come back as Exception values."""
+        tasks = [self._submit(image, self.timeout) for image in images]
+        results = []
+        for future, started in tasks:
+            try:
+                results.append(self._result(future, started, self.timeout))
+                with self._lock:
+                    self.completed += 1
+            except (OCRTimeout, FuturesTimeout):
+                with self._lock:
+                    self.timeouts += 1
+                results.append(OCRTimeout(f"OCR took longer than {self.timeout}s"))
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                results.append(e)
+        return results
+
+    def page_blocks(self, image, timeout=None):
+        """Layout OCR of a full page render (see OCRBackend.image_to_blocks)."""
+        timeout = timeout or self.timeout
+        future, started = self._submit(image, timeout, layout=True)
+        try:
+            blocks = self._result(future, started, timeout)
+        except (OCRTimeout, FuturesTimeout):
+            with self._lock:
+                self.timeouts += 1
+            raise OCRTimeout(f"Page OCR took longer than {timeout}s")
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return blocks
+
+    def stats(self):
+        with self._lock:
+            calls = self.completed + self.failed + self.timeouts
+            return {
+                "backend": self.backend.name,
+                "maxWorkers": self.max_workers,
+                "inFlight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "avgMs": round(1000 * self.total_seconds / calls, 1) if calls else None,
+            }
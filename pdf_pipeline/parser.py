@@ -1,54 +1,336 @@
 import os
+import io
+import re
+import sys
+import threading
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
 import fitz  # PyMuPDF
 from PIL import Image
-import numpy as np
-import torch
 IMAGE_DIR = "/tmp/images" if os.environ.get("RENDER") else "images"
-# Optional imports
-try:
-    import pytesseract
-except:
-    pytesseract = None
+# 1 = also write every extracted image to IMAGE_DIR (debugging only)
+PARSER_DEBUG_IMAGES = os.environ.get("PARSER_DEBUG_IMAGES", "0") == "1"
+from pdf_pipeline.batching import MicroBatcher
+from pdf_pipeline.inference_cache import image_digest
+from pdf_pipeline.layout import IMAGE, build_ocr_layout, build_page_layout
+from pdf_pipeline.ocr import OCRPool
+from pdf_pipeline.scan import is_scanned_page, render_for_ocr
+from pdf_pipeline.triage import CAPTION, OCR, SKIP, TRIAGE_OCR_MAX_SIDE, triage_image
 
-try:
-    import cv2
-except:
-    cv2 = None
+MODEL_CACHE = "/tmp" if os.environ.get("RENDER") else None
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+# 1 = start loading BLIP in the background at import instead of on first caption
+BLIP_PRELOAD = os.environ.get("BLIP_PRELOAD", "0") == "1"
+
+# Images per processor/generate call (memory grows with batch size)
+BLIP_MAX_BATCH = int(os.environ.get("BLIP_MAX_BATCH", "8"))
+BLIP_MAX_NEW_TOKENS = 30
+# How long the inference worker waits to fill a batch across requests
+BLIP_BATCH_WAIT_MS = float(os.environ.get("BLIP_BATCH_WAIT_MS", "10"))
+
+# fp32 = full-precision BLIP; int8 = dynamically quantized Linear layers
+# (CPU only: ~2x faster and ~half the memory, captions differ slightly; see
+# benchmarks/bench_caption_modes.py)
+BLIP_INFERENCE_MODE = os.environ.get("BLIP_INFERENCE_MODE", "fp32")
+BLIP_INFERENCE_MODES = ("fp32", "int8")
+
+# Intra-op threads for inference; one inference worker uses them all, so
+# concurrent requests don't oversubscribe the cores
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS") or os.cpu_count() or 1)
 
-from transformers import BlipProcessor, BlipForConditionalGeneration
 
 # ======================================================
-# 🔹 Setup Device (GPU if available)
+# 🔹 Lazy BLIP Model
 # ======================================================
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-MODEL_CACHE = "/tmp" if os.environ.get("RENDER") else None
+# torch/transformers and the weights are only loaded when the first caption is
+# needed, so processes that never caption (auth, chat) start fast and small.
+DEVICE = None
+processor = None
+model = None
+
+_blip_lock = threading.Lock()
+_blip_state = {
+    "state": "not_loaded",  # not_loaded | loading | ready | failed
+    "mode": BLIP_INFERENCE_MODE,
+    "device": None,
+    "loadSeconds": None,
+    "warmupMs": None,
+    "error": None,
+}
+
+
+def build_blip(mode=BLIP_INFERENCE_MODE):
+    """
+    Load a fresh (processor, model, device) for the given inference mode.
+    Does not touch the shared model; load_blip() is what the parser uses.
+    """
+    if mode not in BLIP_INFERENCE_MODES:
+        raise ValueError(f"Unknown BLIP_INFERENCE_MODE: {mode}")
+
+    import torch
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
+    torch.set_num_threads(TORCH_NUM_THREADS)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    blip_processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME, cache_dir=MODEL_CACHE)
+    blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME, cache_dir=MODEL_CACHE)
+    blip_model.eval()
+
+    if mode == "int8":
+        # Dynamic quantization only has CPU kernels
+        device = "cpu"
+        blip_model = torch.quantization.quantize_dynamic(
+            blip_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    blip_model.to(device)
+    return blip_processor, blip_model, device
+
+
+def load_blip():
+    """Load BLIP once (thread-safe) and return (processor, model)."""
+    global DEVICE, processor, model
+    if model is not None:
+        return processor, model
+
+    with _blip_lock:
+        if model is not None:
+            return processor, model
+
+        _blip_state.update(state="loading", error=None)
+        started = time.perf_counter()
+        try:
+            print(f"🔄 Loading BLIP model ({BLIP_INFERENCE_MODE})...")
+            blip_processor, blip_model, device = build_blip(BLIP_INFERENCE_MODE)
+        except Exception as e:
+            _blip_state.update(state="failed", error=str(e))
+            raise
+
+        DEVICE, processor, model = device, blip_processor, blip_model
+        _blip_state.update(
+            state="ready",
+            device=device,
+            loadSeconds=round(time.perf_counter() - started, 2),
+        )
+        print("✅ BLIP loaded on", DEVICE)
+        return processor, model
+
+
+def start_blip_loading():
+    """Kick off load_blip() in a background thread (no-op if already loaded)."""
+    if _blip_state["state"] in ("not_loaded", "failed"):
+        _blip_state["state"] = "loading"
+        threading.Thread(target=_load_blip_quietly, name="blip-loader", daemon=True).start()
+
+
+def _load_blip_quietly():
+    try:
+        load_blip()
+    except Exception as e:
+        print(f"BLIP load failed: {e}")
+
+
+def warmup_blip():
+    """
+    Load the model if needed and caption one tiny image, so the first real
+    request doesn't pay for lazy kernel/allocator setup. Returns blip_status().
+    """
+    load_blip()
+    if _blip_state["warmupMs"] is None:
+        started = time.perf_counter()
+        caption = caption_images([Image.new("RGB", (64, 64), "white")])[0]
+        if isinstance(caption, Exception):
+            raise caption
+        _blip_state["warmupMs"] = round(1000 * (time.perf_counter() - started), 1)
+    return blip_status()
+
+
+def blip_status():
+    return dict(_blip_state, ready=_blip_state["state"] == "ready" and _blip_state["warmupMs"] is not None)
+
+
 # ======================================================
-# 🔹 Load BLIP Model Globally (IMPORTANT for performance)
+# 🔹 Batched BLIP Captioning
 # ======================================================
-print("🔄 Loading BLIP model...")
-processor = BlipProcessor.from_pretrained(
-    "Salesforce/blip-image-captioning-base",
-    cache_dir=MODEL_CACHE
-)
-model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base",
-    cache_dir=MODEL_CACHE
+def caption_images(images, max_batch=BLIP_MAX_BATCH, blip=None):
+    """
+    Captions for a list of PIL images, in input order. Images are grouped by
+    size so each batch holds similar shapes, then captioned with one
+    processor/generate call per batch. Each image of a failed batch gets the
+    batch's Exception in its slot instead of a caption.
+
+    blip: optional (processor, model, device) from build_blip(); defaults to
+    the shared model.
+    """
+    if blip:
+        processor, model, device = blip
+    else:
+        processor, model = load_blip()
+        device = DEVICE
+    import torch
+
+    captions = [None] * len(images)
+    order = sorted(range(len(images)), key=lambda i: images[i].size[0] * images[i].size[1])
+
+    for start in range(0, len(order), max_batch):
+        idx = order[start:start + max_batch]
+        try:
+            inputs = processor(images=[images[i] for i in idx], return_tensors="pt").to(device)
+            with torch.no_grad():
+                output = model.generate(**inputs, max_new_tokens=BLIP_MAX_NEW_TOKENS)
+            texts = processor.batch_decode(output, skip_special_tokens=True)
+            for i, text in zip(idx, texts):
+                captions[i] = text
+        except Exception as e:
+            for i in idx:
+                captions[i] = e
+
+    return captions
+
+
+# ======================================================
+# 🔹 Shared Inference Worker
+# ======================================================
+# Caption requests from every request thread are merged into one batch
+caption_batcher = MicroBatcher(
+    lambda images: caption_images(images, max_batch=BLIP_MAX_BATCH),
+    max_batch=BLIP_MAX_BATCH,
+    max_wait_ms=BLIP_BATCH_WAIT_MS,
+    name="blip-batcher",
 )
-model.to(DEVICE)
-model.eval()
 
-print("✅ BLIP loaded on", DEVICE)
+if BLIP_PRELOAD:
+    start_blip_loading()
 
 # ======================================================
-# 🔹 Set Tesseract path (Windows only)
+# 🔹 Shared OCR Pool
 # ======================================================
-if pytesseract and os.name == "nt":
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# Process-wide cap on concurrent Tesseract runs (OCR_MAX_CONCURRENCY)
+ocr_pool = OCRPool()
+
+
+def set_thread_limits(torch_threads=None, ocr_workers=None):
+    """
+    Per-process caps on BLIP intra-op threads and concurrent OCR runs,
+    replacing TORCH_NUM_THREADS / OCR_MAX_CONCURRENCY (which are read at
+    import). Parser pool children call this with their share of the cores.
+    """
+    global TORCH_NUM_THREADS
+    if torch_threads:
+        TORCH_NUM_THREADS = torch_threads
+        # Already imported (BLIP loaded or loading): apply it now too
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(torch_threads)
+    if ocr_workers:
+        ocr_pool.resize(ocr_workers)
+
+# Bump these when OCR/caption settings change so cached results are not reused
+OCR_CACHE_VERSION = f"{ocr_pool.backend.version}:max{TRIAGE_OCR_MAX_SIDE}"
+CAPTION_CACHE_VERSION = f"{BLIP_MODEL_NAME}:{BLIP_INFERENCE_MODE}:{BLIP_MAX_NEW_TOKENS}"
+
+
+# Formats PIL decodes directly from the embedded bytes
+PIL_IMAGE_EXTS = {"png", "jpeg", "jpg", "bmp", "gif", "tiff", "tif", "webp", "pnm", "pbm", "pgm", "ppm"}
+
+
+class PageImage:
+    """
+    An extracted image kept in memory: the encoded bytes as stored in the PDF,
+    decoded by PIL straight from memory. Formats PIL can't read (JBIG2, JPX,
+    CMYK oddities) are decoded by MuPDF instead and wrapped around the
+    Pixmap samples without copying them.
+    """
+    __slots__ = ("data", "ext", "doc", "xref", "decoded")
+
+    def __init__(self, data, ext, doc=None, xref=None):
+        self.data = data
+        self.ext = ext
+        self.doc = doc
+        self.xref = xref
+        self.decoded = None
+
+    def detach(self):
+        """
+        Do any MuPDF decoding now and drop the document reference, so the
+        image can be processed on another thread while the document is used
+        for the next page.
+        """
+        if self.doc and self.xref:
+            try:
+                if self.ext not in PIL_IMAGE_EXTS:
+                    raise ValueError(self.ext)
+                Image.open(io.BytesIO(self.data))  # header only
+            except Exception:
+                self.decoded = self._from_pixmap()
+        self.doc = None
+
+    def open(self):
+        if self.decoded is not None:
+            return self.decoded
+        if self.ext in PIL_IMAGE_EXTS or not (self.doc and self.xref):
+            try:
+                return Image.open(io.BytesIO(self.data))
+            except Exception:
+                if not (self.doc and self.xref):
+                    raise
+        return self._from_pixmap()
+
+    def _from_pixmap(self):
+        pix = fitz.Pixmap(self.doc, self.xref)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        if pix.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        mode = "L" if pix.n == 1 else "RGB"
+        # frombuffer shares pix.samples_mv instead of copying it; hold on to
+        # the Pixmap for as long as the image lives
+        image = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+        image.pixmap = pix
+        return image
+
+
+class _PreparedPage:
+    __slots__ = ("page_no", "scan", "layout", "images")
+
+    def __init__(self, page_no, scan=None, layout=None, images=None):
+        self.page_no = page_no
+        self.scan = scan  # (render, scale, width, height) for scanned pages
+        self.layout = layout
+        self.images = images
+
+
+def chunk_text(text, max_chars):
+    """
+    Split text into chunks of at most max_chars, breaking between words
+    (a single word longer than max_chars is cut).
+    """
+    chunks = []
+    current = []
+    size = 0
+    for token in re.findall(r"\S+\s*", text):
+        while len(token.rstrip()) > max_chars:
+            if current:
+                chunks.append("".join(current).strip())
+                current, size = [], 0
+            chunks.append(token[:max_chars])
+            token = token[max_chars:]
+        if size + len(token.rstrip()) > max_chars and current:
+            chunks.append("".join(current).strip())
+            current, size = [], 0
+        current.append(token)
+        size += len(token)
+    if current and "".join(current).strip():
+        chunks.append("".join(current).strip())
+    return chunks
 
 
 class PDFParser:
-    def __init__(self, max_chunk_chars=1000):
+    def __init__(self, max_chunk_chars=1000, inference_cache=None):
         self.max_chunk_chars = max_chunk_chars
+        # Optional InferenceCache for OCR text / captions of repeated images
+        self.inference_cache = inference_cache
 
     # ======================================================
     # 🔹 Process Single Page
@@ -59,131 +341,283 @@ class PDFParser:
         except Exception as e:
             return f"Error opening PDF: {str(e)}"
 
-        if page_no > len(doc) or page_no < 1:
-            return "Invalid Page Number"
+        try:
+            return self.process_page(doc, page_no)
+        finally:
+            doc.close()
 
+    # ======================================================
+    # 🔹 Process Page of an already-open Document
+    # ======================================================
+    def process_page(self, doc, page_no, stats=None, scanned=None):
+        text, _ = self.process_page_layout(doc, page_no, stats, scanned)
+        return text
+
+    def process_page_layout(self, doc, page_no, stats=None, scanned=None):
+        """
+        (flat_text, layout) for a page. layout is PageLayout.to_dict(): the
+        page's blocks in reading order with kind, bbox and font size, or None
+        for an invalid page number.
+
+        scanned: True/False when already known (stored metadata), None to
+        detect it here. Scanned pages get one full-page OCR pass instead of
+        per-image OCR/captioning.
+        """
+        return self.finish_page(self.prepare_page(doc, page_no, scanned), stats)
+
+    def prepare_page(self, doc, page_no, scanned=None):
+        """
+        Stage 1, everything that touches the (not thread-safe) document:
+        scanned check and render, or text/layout + image extraction. The
+        result no longer needs the document, so callers sharing a handle
+        can give it back before finish_page(). None for an invalid page.
+        """
+        if page_no > len(doc) or page_no < 1:
+            return None
         page = doc[page_no - 1]
-        
-        os.makedirs(IMAGE_DIR, exist_ok=True)
-
-        # Extract content
-        raw_text, page_image_data = self.extract_page_content(page, page_no, doc)
 
-        # Process images
-        image_results = self.process_images_for_page(page_image_data)
+        if scanned is None:
+            scanned = is_scanned_page(page)
+        if scanned and ocr_pool.available():
+            image, scale = render_for_ocr(page)
+            return _PreparedPage(page_no, scan=(image, scale, page.rect.width, page.rect.height))
+
+        layout, page_image_data = self.extract_page_content(page, page_no, doc)
+        for page_image in page_image_data.values():
+            page_image.detach()
+        return _PreparedPage(page_no, layout=layout, images=page_image_data)
+
+    def finish_page(self, prepared, stats=None):
+        """Stage 2, no document access: OCR / captioning. Returns (flat_text, layout)."""
+        if prepared is None:
+            return "Invalid Page Number", None
+        if prepared.scan:
+            # Scanned page: one full-page OCR pass (a whole page at 300 dpi
+            # takes a lot longer than one figure)
+            image, scale, width, height = prepared.scan
+            blocks = ocr_pool.page_blocks(image, timeout=ocr_pool.timeout * 4)
+            layout = build_ocr_layout(blocks, scale, width, height)
+            if stats is not None:
+                stats.setdefault("triage", {})["scannedPage"] = 1
+            return layout.flat_text(), layout.to_dict()
+
+        layout = prepared.layout
+        image_results = self.process_images_for_page(prepared.images, stats)
+
+        # Image blocks carry their OCR text / caption
+        for block in layout.blocks:
+            if block.kind == IMAGE:
+                block.text = image_results.get(block.text, "")
+
+        return layout.flat_text(), layout.to_dict()
 
-        # Replace placeholders
-        final_text = raw_text
-        for key, result in image_results.items():
-            final_text = final_text.replace(f"[IMAGE_{key}]", result)
-
-        return final_text.strip()
+    # ======================================================
+    # 🔹 Whole Document (streaming)
+    # ======================================================
+    def iter_pages(self, doc, page_numbers=None, chunks=False, scanned_pages=None):
+        """
+        Parse pages of an open document in order, yielding one dict per page
+        as it finishes: pageNumber, text, layout, stats (+ chunks of at most
+        max_chunk_chars when chunks=True).
+
+        Extraction of page N+1 runs on a helper thread while page N is OCR'd
+        and captioned, and only those two pages are held at a time, so memory
+        stays flat for any page count.
+
+        scanned_pages: page numbers known to be scans (stored metadata), or
+        None to check each page.
+        """
+        numbers = iter(range(1, len(doc) + 1) if page_numbers is None else page_numbers)
+
+        def prepare(page_no):
+            scanned = None if scanned_pages is None else page_no in scanned_pages
+            return self.prepare_page(doc, page_no, scanned)
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-extract") as extractor:
+            next_no = next(numbers, None)
+            pending = extractor.submit(prepare, next_no) if next_no is not None else None
+            while pending is not None:
+                page_no, prepared = next_no, pending.result()
+                next_no = next(numbers, None)
+                pending = extractor.submit(prepare, next_no) if next_no is not None else None
+
+                stats = {}
+                text, layout = self.finish_page(prepared, stats)
+                prepared = None
+
+                page = {"pageNumber": page_no, "text": text, "layout": layout, "stats": stats}
+                if chunks:
+                    page["chunks"] = chunk_text(text, self.max_chunk_chars)
+                yield page
+
+    def process_document(self, pdf_path, page_numbers=None, chunks=False, scanned_pages=None):
+        """iter_pages() over a PDF file, opened once and closed when done."""
+        doc = fitz.open(pdf_path)
+        try:
+            yield from self.iter_pages(doc, page_numbers, chunks, scanned_pages)
+        finally:
+            doc.close()
 
     # ======================================================
     # 🔹 Extract Page Content
     # ======================================================
     def extract_page_content(self, page, page_no, doc):
-        blocks = page.get_text("dict")["blocks"]
-        page_text = ""
+        """
+        (PageLayout, page_image_data). Image blocks hold their image key as
+        text until process_page_layout fills in the OCR text / caption.
+        """
+        layout = build_page_layout(page.get_text("dict"))
         img_counter = 0
         page_image_data = {}
 
-        for block in blocks:
-            # TEXT BLOCK
-            if block.get("type") == 0:
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        page_text += span.get("text", "") + " "
-
-            # IMAGE BLOCK
-            elif block.get("type") == 1:
-                img_counter += 1
-                img_name = f"page{page_no}_img{img_counter}"
-
-                image_bytes = None
-                ext = "png"
-
-                # Try xref extraction
-                if "xref" in block:
-                    try:
-                        base_image = doc.extract_image(block["xref"])
-                        image_bytes = base_image["image"]
-                        ext = base_image["ext"]
-                    except:
-                        pass
-
-                # Fallback
-                if image_bytes is None and "image" in block:
-                    image_bytes = block["image"]
-                    ext = block.get("ext", "png")
-
-                # Save image
-                if image_bytes:
-                    img_path = f"{IMAGE_DIR}/{img_name}.{ext}"
-                    try:
-                        with open(img_path, "wb") as f:
-                            f.write(image_bytes)
-
-                        page_text += f" [IMAGE_{img_name}] "
-                        page_image_data[img_name] = img_path
-
-                    except Exception as e:
-                        print(f"Error saving image: {e}")
-
-        return page_text, page_image_data
+        for block in layout.blocks:
+            if block.kind != IMAGE:
+                continue
+
+            raw, block.raw = block.raw, None
+            img_counter += 1
+            img_name = f"page{page_no}_img{img_counter}"
+            block.text = img_name
+
+            image_bytes = None
+            ext = "png"
+
+            # Try xref extraction
+            if "xref" in raw:
+                try:
+                    base_image = doc.extract_image(raw["xref"])
+                    image_bytes = base_image["image"]
+                    ext = base_image["ext"]
+                except:
+                    pass
+
+            # Fallback
+            if image_bytes is None and "image" in raw:
+                image_bytes = raw["image"]
+                ext = raw.get("ext", "png")
+
+            # Keep image in memory
+            if image_bytes:
+                page_image_data[img_name] = PageImage(image_bytes, ext, doc, raw.get("xref"))
+
+                if PARSER_DEBUG_IMAGES:
+                    self._write_debug_image(img_name, ext, image_bytes)
+
+        return layout, page_image_data
+
+    @staticmethod
+    def _write_debug_image(img_name, ext, image_bytes):
+        # Unique prefix: concurrent parses of the same page number must not collide
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        try:
+            with open(f"{IMAGE_DIR}/{uuid.uuid4().hex[:8]}_{img_name}.{ext}", "wb") as f:
+                f.write(image_bytes)
+        except Exception as e:
+            print(f"Error saving debug image: {e}")
 
     # ======================================================
-    # 🔹 Process Images (OCR + BLIP)
+    # 🔹 Process Images (Triage → OCR / BLIP)
     # ======================================================
-    def process_images_for_page(self, page_image_data):
+    def process_images_for_page(self, page_image_data, stats=None):
+        """
+        stats, when given, is filled with two counter dicts:
+        - "triage": images skipped (by reason), routed and downscaled
+        - "imageCache": ocrHits/ocrMisses/captionHits/captionMisses
+        """
         results = {}
-
-        for key, img_path in page_image_data.items():
+        to_caption = {}  # key -> PIL image
+        digests = {}  # key -> sha256 of the image bytes
+        cache = self.inference_cache
+        stats = stats if stats is not None else {}
+        triage_stats = stats.setdefault("triage", {})
+        cache_stats = stats.setdefault("imageCache", {})
+
+        def count(counters, name):
+            counters[name] = counters.get(name, 0) + 1
+
+        # =========================
+        # Triage: drop decorative images, route the rest
+        # =========================
+        triaged_images = {}  # key -> TriageResult
+        # Keyed by digest: the same image repeated on a page is OCR'd once
+        to_ocr = {}  # digest -> PIL image
+        ocr_texts = {}  # digest -> OCR text
+
+        for key, page_image in page_image_data.items():
             try:
-                image = Image.open(img_path).convert("RGB")
+                triaged = triage_image(page_image.open())
             except Exception as e:
                 results[key] = f"(Image load error: {str(e)})"
                 continue
 
-            # =========================
-            # OCR PART
-            # =========================
-            ocr_text = ""
+            count(triage_stats, "images")
+            if triaged.route == SKIP:
+                # Decorative: bullets, rules, blank fills
+                count(triage_stats, "skipped" + triaged.reason[0].upper() + triaged.reason[1:])
+                results[key] = ""
+                continue
+            count(triage_stats, "routed" + triaged.route.capitalize())
+            if triaged.downscaled:
+                count(triage_stats, "downscaled")
+            triaged_images[key] = triaged
 
-            if pytesseract and cv2:
-                try:
-                    gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
-                    ocr_text = pytesseract.image_to_string(gray, config="--psm 6").strip()
-                except Exception as e:
-                    print(f"OCR Error: {e}")
-
-            # =========================
-            # Decision: OCR vs Caption
-            # =========================
+            digest = digests[key] = image_digest(page_image.data)
+            if triaged.route == CAPTION:
+                continue
+            cached = cache.get("ocr", OCR_CACHE_VERSION, digest) if cache else None
+            if cached is not None:
+                count(cache_stats, "ocrHits")
+                ocr_texts[digest] = cached
+            elif ocr_pool.available():
+                to_ocr[digest] = triaged.image
+
+        # =========================
+        # OCR: all uncached images of the page in parallel
+        # =========================
+        if to_ocr:
+            pending = list(to_ocr)
+            for digest, text in zip(pending, ocr_pool.map([to_ocr[d] for d in pending])):
+                if isinstance(text, Exception):
+                    print(f"OCR Error: {text}")
+                    continue
+                ocr_texts[digest] = text
+                if cache:
+                    count(cache_stats, "ocrMisses")
+                    cache.put("ocr", OCR_CACHE_VERSION, digest, text)
+
+        # =========================
+        # Decision: OCR vs Caption
+        # =========================
+        for key, triaged in triaged_images.items():
+            ocr_text = ocr_texts.get(digests[key], "")
+            if triaged.route == OCR:
+                # Text-like: whatever OCR found, never a caption
+                results[key] = f"(Text in Image: {ocr_text})" if ocr_text else ""
+                continue
             if ocr_text and len(ocr_text.strip()) > 15:
                 results[key] = f"(Text in Image: {ocr_text})"
-            else:
-                # =========================
-                # BLIP Captioning
-                # =========================
-                try:
-                    inputs = processor(images=image, return_tensors="pt").to(DEVICE)
-
-                    with torch.no_grad():
-                        output = model.generate(**inputs, max_new_tokens=30)
+                continue
 
-                    caption = processor.decode(output[0], skip_special_tokens=True)
+            caption = cache.get("caption", CAPTION_CACHE_VERSION, digests[key]) if cache else None
+            if caption is not None:
+                count(cache_stats, "captionHits")
+                results[key] = f"(Image Description: {caption})"
+            else:
+                to_caption[key] = triaged.image
+
+        # =========================
+        # BLIP Captioning (one batched pass for the whole page)
+        # =========================
+        if to_caption:
+            keys = list(to_caption)
+            captions = caption_batcher.map([to_caption[k] for k in keys])
+            for key, caption in zip(keys, captions):
+                if isinstance(caption, Exception):
+                    results[key] = f"(Caption error: {str(caption)})"
+                else:
                     results[key] = f"(Image Description: {caption})"
+                    if cache:
+                        count(cache_stats, "captionMisses")
+                        cache.put("caption", CAPTION_CACHE_VERSION, digests[key], caption)
 
-                except Exception as e:
-                    results[key] = f"(Caption error: {str(e)})"
-
-            # =========================
-            # Cleanup (important)
-            # =========================
-            try:
-                os.remove(img_path)
-            except:
-                pass
-
-        return results
\ No newline at end of file
+        return results
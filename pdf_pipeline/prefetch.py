@@ -0,0 +1,186 @@
+import os
+import itertools
+import queue
+import threading
+import time
+
+# ======================================================
+# 🔹 Prefetch Limits
+# ======================================================
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", "2"))
+PREFETCH_MAX_PER_USER = int(os.environ.get("PREFETCH_MAX_PER_USER", "4"))
+PREFETCH_MAX_GLOBAL = int(os.environ.get("PREFETCH_MAX_GLOBAL", "32"))
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "1"))
+# Waits before retrying a page that hit a transient error (parser busy)
+RETRY_BACKOFF_SECONDS = (1, 2, 5)
+
+
+class _PrefetchTask:
+    __slots__ = ("user_key", "pdf_id", "page_no", "language", "cancelled", "running")
+
+    def __init__(self, user_key, pdf_id, page_no, language):
+        self.user_key = user_key
+        self.pdf_id = pdf_id
+        self.page_no = page_no
+        self.language = language
+        self.cancelled = False
+        self.running = False
+
+
+class PagePrefetcher:
+    """
+    Parses the next few pages in the background while a student reads.
+
+    When page N is viewed, pages N+1..N+depth are queued (nearest first) for
+    the same language. Queued pages that fall outside the new window are
+    cancelled when the reader jumps elsewhere. run_page(pdf_id, page_no,
+    language) does the actual parse + store; when it raises one of
+    transient_errors the page is retried after a backoff (it can still be
+    cancelled meanwhile) rather than given up.
+    """
+
+    def __init__(
+        self,
+        run_page,
+        depth=PREFETCH_DEPTH,
+        max_per_user=PREFETCH_MAX_PER_USER,
+        max_global=PREFETCH_MAX_GLOBAL,
+        workers=PREFETCH_WORKERS,
+        transient_errors=(),
+    ):
+        self.run_page = run_page
+        self.transient_errors = tuple(transient_errors)
+        self.depth = depth
+        self.max_per_user = max_per_user
+        self.max_global = max_global
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._tasks = {}  # (pdf_id, page_no, language) -> _PrefetchTask
+        self._per_user = {}  # user_key -> pending count
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+
+        for i in range(workers):
+            threading.Thread(
+                target=self._worker, name=f"prefetch-{i}", daemon=True
+            ).start()
+
+    # ======================================================
+    # 🔹 Internals
+    # ======================================================
+    def _forget(self, key, task):
+        # Caller holds self._lock
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            self._per_user[task.user_key] -= 1
+            if not self._per_user[task.user_key]:
+                del self._per_user[task.user_key]
+
+    def _cancel(self, key, task):
+        # Caller holds self._lock; the worker skips it when dequeued
+        task.cancelled = True
+        self.cancelled += 1
+        self._forget(key, task)
+
+    def _run_task(self, task):
+        for delay in RETRY_BACKOFF_SECONDS + (None,):
+            with self._lock:
+                if task.cancelled:
+                    return
+                task.running = True
+            try:
+                self.run_page(task.pdf_id, task.page_no, task.language)
+                with self._lock:
+                    self.completed += 1
+                return
+            except self.transient_errors as e:
+                if delay is None:
+                    raise
+                # Cancellable again while it waits
+                with self._lock:
+                    task.running = False
+                    self.retried += 1
+                print(f"Prefetch of {task.pdf_id} page {task.page_no} retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+    def _worker(self):
+        while True:
+            _, _, key, task = self._queue.get()
+            try:
+                self._run_task(task)
+            except Exception as e:
+                print(f"Prefetch failed for {task.pdf_id} page {task.page_no}: {e}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self._forget(key, task)
+                self._queue.task_done()
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def on_page_viewed(self, user_key, pdf_id, page_no, language, page_count=None):
+        pdf_id = str(pdf_id)
+        last = page_no + self.depth
+        if page_count:
+            last = min(last, page_count)
+        window = set(range(page_no + 1, last + 1))
+
+        with self._lock:
+            # Reader moved: drop this user's queued pages outside the new window
+            for key, task in list(self._tasks.items()):
+                if (
+                    task.user_key == user_key
+                    and task.pdf_id == pdf_id
+                    and not task.cancelled
+                    and not task.running
+                    and (task.page_no not in window or task.language != language)
+                ):
+                    self._cancel(key, task)
+
+            for distance, target in enumerate(sorted(window), start=1):
+                key = (pdf_id, target, language)
+                if key in self._tasks:
+                    continue
+                if (
+                    self._per_user.get(user_key, 0) >= self.max_per_user
+                    or len(self._tasks) >= self.max_global
+                ):
+                    self.dropped += 1
+                    break
+                task = _PrefetchTask(user_key, pdf_id, target, language)
+                self._tasks[key] = task
+                self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+                self._queue.put((distance, next(self._seq), key, task))
+
+    def cancel(self, pdf_id, page_no, language):
+        """
+        Drop this page from the queue if it hasn't started; a request is
+        about to parse it itself. A prefetch that is already running is left
+        alone (the request joins it through the page's single-flight key).
+        Returns True if a queued task was cancelled.
+        """
+        key = (str(pdf_id), page_no, language)
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None or task.running or task.cancelled:
+                return False
+            self._cancel(key, task)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._tasks),
+                "users": len(self._per_user),
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "retried": self.retried,
+            }
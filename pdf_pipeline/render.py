@@ -0,0 +1,110 @@
+import io
+import math
+import os
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from pdf_pipeline.blob_cache import CACHE_ROOT, DiskLRUCache
+
+# ======================================================
+# 🔹 Render Settings
+# ======================================================
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_MB", "512")) * 1024 * 1024
+RENDER_QUALITY = int(os.environ.get("RENDER_QUALITY", "80"))
+DEFAULT_SCALE = 2.0
+MIN_SCALE = 0.25
+MAX_SCALE = 4.0
+
+# Thumbnails: ~150px wide for an A4 page
+THUMBNAIL_SCALE = float(os.environ.get("THUMBNAIL_SCALE", "0.25"))
+THUMBNAIL_FORMAT = "webp"
+
+# Tiles: fixed-size squares of the page rendered at an arbitrary zoom
+TILE_SIZE = 512
+MAX_TILE_ZOOM = 8.0
+
+# Preferred first when the client accepts several
+IMAGE_MIMETYPES = {
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+
+def clamp_scale(value, default=DEFAULT_SCALE, max_scale=MAX_SCALE):
+    try:
+        scale = float(value)
+    except (TypeError, ValueError):
+        return default
+    if not math.isfinite(scale):
+        return default
+    return min(max_scale, max(MIN_SCALE, scale))
+
+
+def render_cache_key(content_hash, page_no, scale, fmt):
+    return f"{content_hash}-p{page_no}-s{scale:g}-{fmt}"
+
+
+def thumbnail_cache_key(content_hash, page_no, fmt=THUMBNAIL_FORMAT):
+    return render_cache_key(content_hash, page_no, THUMBNAIL_SCALE, fmt)
+
+
+def tile_cache_key(content_hash, page_no, zoom, col, row, fmt):
+    return f"{content_hash}-p{page_no}-z{zoom:g}-t{col}x{row}-{fmt}"
+
+
+def tile_grid(page_rect, zoom, tile_size=TILE_SIZE):
+    """(columns, rows) of tiles covering the page at this zoom."""
+    return (
+        max(1, math.ceil(page_rect.width * zoom / tile_size)),
+        max(1, math.ceil(page_rect.height * zoom / tile_size)),
+    )
+
+
+def encode_pixmap(pix, fmt, quality=RENDER_QUALITY):
+    if fmt == "png":
+        return pix.tobytes("png")
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=quality)
+
+    # WebP isn't a MuPDF output format; hand the raw samples to Pillow
+    mode = "RGBA" if pix.alpha else "RGB"
+    image = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+    buf = io.BytesIO()
+    image.save(buf, format="WEBP", quality=quality, method=4)
+    return buf.getvalue()
+
+
+def render_page(page, scale=DEFAULT_SCALE, fmt="png", quality=RENDER_QUALITY):
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+    return encode_pixmap(pix, fmt, quality)
+
+
+def render_tile(page, zoom, col, row, fmt="png", tile_size=TILE_SIZE, quality=RENDER_QUALITY):
+    """
+    One tile_size x tile_size square of the page at zoom. Only the clip
+    rectangle is rasterized, so deep zoom levels stay cheap.
+    """
+    cols, rows = tile_grid(page.rect, zoom, tile_size)
+    if not (0 <= col < cols and 0 <= row < rows):
+        raise IndexError("Tile out of range")
+
+    step = tile_size / zoom  # tile edge in page units
+    x0 = page.rect.x0 + col * step
+    y0 = page.rect.y0 + row * step
+    clip = fitz.Rect(x0, y0, x0 + step, y0 + step) & page.rect
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    return encode_pixmap(pix, fmt, quality)
+
+
+def render_thumbnails(doc, page_numbers=None, fmt=THUMBNAIL_FORMAT, scale=THUMBNAIL_SCALE):
+    """Yield (page_no, image_bytes) low-DPI thumbnails in one pass over the document."""
+    matrix = fitz.Matrix(scale, scale)
+    for page_no in range(1, len(doc) + 1) if page_numbers is None else page_numbers:
+        pix = doc[page_no - 1].get_pixmap(matrix=matrix, alpha=False)
+        yield page_no, encode_pixmap(pix, fmt)
+
+
+def make_render_cache(max_bytes=RENDER_CACHE_MAX_BYTES):
+    return DiskLRUCache(os.path.join(CACHE_ROOT, "renders"), max_bytes)
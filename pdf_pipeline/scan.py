@@ -0,0 +1,52 @@
+import os
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# ======================================================
+# 🔹 Scanned-Page Settings
+# ======================================================
+# A page with fewer text-layer characters than this...
+SCANNED_MAX_TEXT_CHARS = int(os.environ.get("SCANNED_MAX_TEXT_CHARS", "50"))
+# ...whose images cover at least this fraction of it, is a scan
+SCANNED_MIN_IMAGE_COVERAGE = float(os.environ.get("SCANNED_MIN_IMAGE_COVERAGE", "0.5"))
+# Resolution scanned pages are rendered at for the full-page OCR pass
+SCANNED_OCR_DPI = int(os.environ.get("SCANNED_OCR_DPI", "300"))
+
+
+def image_coverage(page):
+    """Fraction of the page area covered by images (overlaps counted once per image)."""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page_rect
+        if not rect.is_empty:
+            covered += rect.width * rect.height
+    return min(1.0, covered / page_area)
+
+
+def is_scanned_page(page, text=None):
+    """
+    True when the page has no usable text layer and is mostly image, i.e. a
+    scan that needs full-page OCR. Pass the page's get_text("text") if it is
+    already at hand.
+    """
+    if text is None:
+        text = page.get_text("text")
+    if len(text.strip()) >= SCANNED_MAX_TEXT_CHARS:
+        return False
+    return image_coverage(page) >= SCANNED_MIN_IMAGE_COVERAGE
+
+
+def render_for_ocr(page, dpi=SCANNED_OCR_DPI):
+    """
+    Greyscale render of the page as a PIL image sharing the Pixmap's samples
+    (no copy). Returns (image, scale) where scale maps pixels to PDF points.
+    """
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+    image.pixmap = pix  # keep the samples alive with the image
+    return image, 72.0 / dpi
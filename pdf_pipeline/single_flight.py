@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+# ======================================================
+# 🔹 Single-Flight Settings
+# ======================================================
+# How long a worker may hold a key before others assume it died
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.environ.get("SINGLE_FLIGHT_LEASE_SECONDS", "300"))
+# How often a worker waiting on another worker's lease checks it again
+SINGLE_FLIGHT_POLL_SECONDS = 0.5
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class _Flight:
+    __slots__ = ("key", "done", "result", "error")
+
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs the work for a key at most once at a time.
+
+    Within the process, callers that arrive while a key is in flight wait for
+    the leader and get its result (or its exception). Across workers, the
+    leader also holds a lease document (_id = key) in a Mongo collection; a
+    leader that finds the lease taken waits for it to be released or to
+    expire, then runs the work itself, so the work must first check whether
+    it has already been done (e.g. re-read the stored page).
+
+    do(key, fn) covers the common case; acquire()/finish() are for leaders
+    that produce their result incrementally (streaming responses).
+    """
+
+    def __init__(self, collection=None, lease_seconds=SINGLE_FLIGHT_LEASE_SECONDS,
+                 poll_seconds=SINGLE_FLIGHT_POLL_SECONDS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_waits = 0
+        self.stale_leases = 0
+
+        if collection is not None:
+            try:
+                # Leases of crashed workers are cleaned up by Mongo eventually
+                collection.create_index("expiresAt", expireAfterSeconds=0)
+            except Exception as e:
+                print(f"Single-flight index creation failed: {e}")
+
+    # ======================================================
+    # 🔹 Mongo Lease
+    # ======================================================
+    def _try_lease(self, key):
+        if self.collection is None:
+            return True
+        now = _now()
+        lease = {"owner": self.owner, "expiresAt": now + timedelta(seconds=self.lease_seconds)}
+        try:
+            self.collection.insert_one(dict(lease, _id=key))
+            return True
+        except DuplicateKeyError:
+            pass
+        # Held by a worker that died (or overran its lease): take it over
+        stolen = self.collection.find_one_and_update(
+            {"_id": key, "expiresAt": {"$lt": now}},
+            {"$set": lease},
+        )
+        if stolen is None:
+            return False
+        with self._lock:
+            self.stale_leases += 1
+        return True
+
+    def _release(self, key):
+        if self.collection is not None:
+            self.collection.delete_one({"_id": key, "owner": self.owner})
+
+    # ======================================================
+    # 🔹 Public API
+    # ======================================================
+    def acquire(self, key, timeout=None):
+        """
+        Returns (flight, None) when the caller leads and must call finish(),
+        or (None, result) with the result of a leader it waited for.
+        Raises the leader's exception, or SingleFlightTimeout.
+        """
+        timeout = timeout or self.lease_seconds
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(key)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise SingleFlightTimeout(f"Still waiting for {key} after {timeout}s")
+            if flight.error is not None:
+                raise flight.error
+            return None, flight.result
+
+        # Leader in this process; another worker may be on the same key
+        try:
+            deadline = time.monotonic() + timeout
+            waited = False
+            while not self._try_lease(key):
+                if not waited:
+                    waited = True
+                    with self._lock:
+                        self.remote_waits += 1
+                if time.monotonic() > deadline:
+                    raise SingleFlightTimeout(f"{key} is held by another worker")
+                time.sleep(self.poll_seconds)
+        except BaseException as e:
+            self.finish(flight, error=e, leased=False)
+            raise
+        with self._lock:
+            self.leaders += 1
+        return flight, None
+
+    def finish(self, flight, result=None, error=None, leased=True):
+        """Hand the leader's result (or exception) to its followers and release the key."""
+        try:
+            if leased:
+                self._release(flight.key)
+        finally:
+            flight.result = result
+            flight.error = error
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            flight.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """fn() once for concurrent callers of the same key; all get its result."""
+        flight, result = self.acquire(key, timeout)
+        if flight is None:
+            return result
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(flight, error=e)
+            raise
+        self.finish(flight, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "inFlight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "remoteWaits": self.remote_waits,
+                "staleLeases": self.stale_leases,
+            }
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except:
+    cv2 = None
+
+# ======================================================
+# 🔹 Triage Thresholds
+# ======================================================
+# Smaller than this on either side: bullets, dots, icons
+TRIAGE_MIN_SIDE = int(os.environ.get("TRIAGE_MIN_SIDE", "24"))
+# Long thin strips: rules, underlines, borders
+TRIAGE_MAX_ASPECT = float(os.environ.get("TRIAGE_MAX_ASPECT", "12"))
+# Grey-level std below this: blank or flat-colour fills
+TRIAGE_MIN_STD = 6.0
+# Histogram entropy (bits) below this, with almost no edges: near-uniform
+# textures/backgrounds (line diagrams are low-entropy too, but have edges)
+TRIAGE_MIN_ENTROPY = 1.0
+TRIAGE_MIN_EDGES = 0.01
+# Edge density of dense glyphs; line art stays well below it
+TEXT_MIN_EDGES = 0.1
+# Downscale targets: Tesseract gains nothing past ~300 dpi, BLIP sees 384px
+TRIAGE_OCR_MAX_SIDE = int(os.environ.get("TRIAGE_OCR_MAX_SIDE", "2000"))
+TRIAGE_CAPTION_MAX_SIDE = int(os.environ.get("TRIAGE_CAPTION_MAX_SIDE", "768"))
+# Side of the thumbnail the measures are computed on
+ANALYSIS_SIDE = 128
+
+SKIP = "skip"
+OCR = "ocr"
+CAPTION = "caption"
+BOTH = "both"  # unclear: OCR first, caption if little text is found
+
+
+class TriageResult:
+    __slots__ = ("route", "reason", "image", "downscaled")
+
+    def __init__(self, route, reason, image=None, downscaled=False):
+        self.route = route
+        self.reason = reason
+        self.image = image
+        self.downscaled = downscaled
+
+
+def _entropy(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    p = hist[hist > 0] / gray.size
+    return float(-(p * np.log2(p)).sum())
+
+
+def _colorfulness(rgb):
+    # Hasler & Süsstrunk: ~0 for greyscale scans, >30 for photos/charts
+    r, g, b = (rgb[..., i].astype(np.float32) for i in range(3))
+    rg = r - g
+    yb = 0.5 * (r + g) - b
+    return float(np.hypot(rg.std(), yb.std()) + 0.3 * np.hypot(rg.mean(), yb.mean()))
+
+
+def _edge_density(gray):
+    if cv2 is not None:
+        edges = cv2.Canny(gray, 100, 200)
+        return float(np.count_nonzero(edges)) / edges.size
+    dx = np.abs(np.diff(gray.astype(np.int16), axis=1)) > 40
+    dy = np.abs(np.diff(gray.astype(np.int16), axis=0)) > 40
+    return float(dx.sum() + dy.sum()) / gray.size
+
+
+def image_measures(image):
+    """Cheap measures of a PIL image, computed on a small thumbnail."""
+    thumb = image.convert("RGB")
+    thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    rgb = np.asarray(thumb)
+    gray = np.asarray(thumb.convert("L"))
+    return {
+        "std": float(gray.std()),
+        "entropy": _entropy(gray),
+        "colorfulness": _colorfulness(rgb),
+        "edgeDensity": _edge_density(gray),
+        # Ink-on-paper images are mostly near-black or near-white pixels
+        "extremes": float(np.mean((gray < 64) | (gray > 192))),
+    }
+
+
+def _downscale(image, max_side):
+    if max(image.size) <= max_side:
+        return image, False
+    image = image.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image, True
+
+
+def triage_image(image):
+    """
+    Decide what an extracted image needs: SKIP (decorative), OCR (text-like),
+    CAPTION (photo-like) or BOTH. Returns a TriageResult whose image is RGB
+    and already downscaled for its route.
+
+    `image` may be a lazily opened PIL image: the size checks run before the
+    pixels are decoded, and JPEGs are decoded at reduced size when large.
+    """
+    width, height = image.size
+    if max(width, height) / max(1, min(width, height)) > TRIAGE_MAX_ASPECT:
+        return TriageResult(SKIP, "rule")
+    if min(width, height) < TRIAGE_MIN_SIDE:
+        return TriageResult(SKIP, "tiny")
+
+    if image.format == "JPEG":
+        image.draft("RGB", (TRIAGE_OCR_MAX_SIDE, TRIAGE_OCR_MAX_SIDE))
+    image = image.convert("RGB")
+
+    m = image_measures(image)
+    if m["std"] < TRIAGE_MIN_STD:
+        return TriageResult(SKIP, "blank")
+    if m["entropy"] < TRIAGE_MIN_ENTROPY and m["edgeDensity"] < TRIAGE_MIN_EDGES:
+        return TriageResult(SKIP, "lowEntropy")
+
+    if m["colorfulness"] < 15 and m["extremes"] > 0.85 and m["edgeDensity"] > TEXT_MIN_EDGES:
+        route = OCR
+    elif m["colorfulness"] > 30 or m["extremes"] < 0.5:
+        route = CAPTION
+    else:
+        route = BOTH
+
+    max_side = TRIAGE_CAPTION_MAX_SIDE if route == CAPTION else TRIAGE_OCR_MAX_SIDE
+    image, downscaled = _downscale(image, max_side)
+    return TriageResult(route, None, image, downscaled)
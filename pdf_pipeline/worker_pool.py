@@ -0,0 +1,236 @@
+import os
+import multiprocessing
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# ======================================================
+# 🔹 Pool Settings
+# ======================================================
+# 0 = parse inline in the request thread (default, same as before)
+PARSER_PROCESSES = int(os.environ.get("PARSER_PROCESSES", "0"))
+PARSER_MAX_TASKS_PER_CHILD = int(os.environ.get("PARSER_MAX_TASKS_PER_CHILD", "50"))
+PARSER_TASK_TIMEOUT = float(os.environ.get("PARSER_TASK_TIMEOUT", "120"))
+PARSER_MAX_QUEUE = int(os.environ.get("PARSER_MAX_QUEUE", str(max(1, PARSER_PROCESSES) * 2)))
+CHILD_MAX_OPEN_DOCS = 2
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class PoolTaskTimeout(Exception):
+    pass
+
+
+# ======================================================
+# 🔹 Child Process Side
+# ======================================================
+_child_parser = None
+_child_docs = OrderedDict()  # pdf_path -> fitz.Document
+_child_started = None  # queue of task ids, tells the parent a task began
+
+
+def _init_child(torch_threads, ocr_workers, started_queue):
+    # This child's share of the cores. Passed in rather than set through the
+    # environment: pdf_pipeline.parser may already be imported (and have read
+    # it) by the time the initializer runs
+    from pdf_pipeline.inference_cache import make_inference_cache
+    from pdf_pipeline.parser import PDFParser, load_blip, set_thread_limits
+    set_thread_limits(torch_threads=torch_threads, ocr_workers=ocr_workers)
+
+    # BLIP is loaded once for the lifetime of this child
+    global _child_parser, _child_started
+    _child_started = started_queue
+    load_blip()
+    _child_parser = PDFParser(inference_cache=make_inference_cache())
+
+
+def _child_document(pdf_path):
+    import fitz
+
+    doc = _child_docs.get(pdf_path)
+    if doc is not None:
+        _child_docs.move_to_end(pdf_path)
+        return doc
+    doc = fitz.open(pdf_path)
+    _child_docs[pdf_path] = doc
+    while len(_child_docs) > CHILD_MAX_OPEN_DOCS:
+        _, old = _child_docs.popitem(last=False)
+        old.close()
+    return doc
+
+
+def _parse_in_child(task_id, pdf_path, page_no, scanned=None):
+    # The parent's timeout starts now, not when the task was queued
+    _child_started.put(task_id)
+    stats = {}
+    text, layout = _child_parser.process_page_layout(_child_document(pdf_path), page_no, stats, scanned)
+    return text, layout, stats
+
+
+def _warmup_in_child():
+    from pdf_pipeline.parser import warmup_blip
+    return warmup_blip()
+
+
+# ======================================================
+# 🔹 Parent Side
+# ======================================================
+class ParserProcessPool:
+    """
+    Runs PDFParser page jobs (PyMuPDF extraction, Tesseract, BLIP) in child
+    processes so CPU work leaves the Flask request threads.
+
+    - every child loads the BLIP model once, in its initializer
+    - children are replaced after max_tasks_per_child jobs to cap memory growth
+    - at most processes + max_queue jobs are admitted; beyond that PoolBusy
+    - a job over its timeout recycles the pool (a stuck child can't be
+      cancelled any other way) and raises PoolTaskTimeout; the timeout
+      counts from when a child starts the job, not from admission
+    - jobs killed or cancelled by someone else's recycle are resubmitted
+    """
+
+    def __init__(
+        self,
+        processes=PARSER_PROCESSES,
+        max_tasks_per_child=PARSER_MAX_TASKS_PER_CHILD,
+        task_timeout=PARSER_TASK_TIMEOUT,
+        max_queue=PARSER_MAX_QUEUE,
+    ):
+        self.processes = processes
+        self.max_tasks_per_child = max_tasks_per_child
+        self.task_timeout = task_timeout
+        self._slots = threading.BoundedSemaphore(processes + max_queue)
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("spawn")
+        self._started = self._context.Queue()
+        self._start_events = {}  # task id -> threading.Event
+        self._task_ids = itertools.count()
+        self._executor = self._new_executor()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycles = 0
+        self.resubmits = 0
+
+        threading.Thread(target=self._watch_starts, name="parser-pool-starts", daemon=True).start()
+
+    def _new_executor(self):
+        # Split this process's thread caps between the children instead of
+        # each one grabbing all of them
+        from pdf_pipeline.ocr import OCR_MAX_CONCURRENCY
+        from pdf_pipeline.parser import TORCH_NUM_THREADS
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=self._context,
+            initializer=_init_child,
+            initargs=(
+                max(1, TORCH_NUM_THREADS // self.processes),
+                max(1, OCR_MAX_CONCURRENCY // self.processes),
+                self._started,
+            ),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    def _watch_starts(self):
+        while True:
+            task_id = self._started.get()
+            with self._lock:
+                event = self._start_events.get(task_id)
+            if event:
+                event.set()
+
+    def _run(self, executor, pdf_path, page_no, scanned, timeout):
+        task_id = next(self._task_ids)
+        started = threading.Event()
+        with self._lock:
+            self._start_events[task_id] = started
+        try:
+            future = executor.submit(_parse_in_child, task_id, pdf_path, page_no, scanned)
+            # Queued behind other pages: no deadline yet (a dead pool
+            # finishes the future, so this can't wait forever)
+            while not started.wait(0.5):
+                if future.done():
+                    break
+            return future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._start_events.pop(task_id, None)
+
+    def _recycle(self, broken):
+        with self._lock:
+            if self._executor is not broken:
+                return  # someone already replaced it
+            self._executor = self._new_executor()
+            self.recycles += 1
+        # Private, but the only way to stop a child stuck in Tesseract/BLIP
+        for proc in list((getattr(broken, "_processes", None) or {}).values()):
+            proc.terminate()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def parse_page(self, pdf_path, page_no, timeout=None, stats=None, scanned=None):
+        """(flat_text, layout) for a page, like PDFParser.process_page_layout."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy("Parser is busy, try again shortly")
+
+        timeout = timeout or self.task_timeout
+        with self._lock:
+            self.in_flight += 1
+        try:
+            for attempt in range(2):
+                executor = self._executor
+                try:
+                    text, layout, child_stats = self._run(executor, pdf_path, page_no, scanned, timeout)
+                    with self._lock:
+                        self.completed += 1
+                    if stats is not None:
+                        for group, counters in child_stats.items():
+                            merged = stats.setdefault(group, {})
+                            for name, value in counters.items():
+                                merged[name] = merged.get(name, 0) + value
+                    return text, layout
+                except FuturesTimeout:
+                    with self._lock:
+                        self.timeouts += 1
+                    self._recycle(executor)
+                    raise PoolTaskTimeout(f"Page {page_no} took longer than {timeout}s")
+                except (BrokenProcessPool, CancelledError):
+                    # A child died (OOM), or another job's timeout recycled the
+                    # pool under us: retry once on the fresh pool
+                    self._recycle(executor)
+                    if attempt:
+                        raise BrokenProcessPool(f"Parser processes restarted while parsing page {page_no}")
+                    with self._lock:
+                        self.resubmits += 1
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def warmup(self, timeout=None):
+        """Run one warmup caption in a child; returns that child's model status."""
+        return self._executor.submit(_warmup_in_child).result(timeout=timeout or self.task_timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "inFlight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "recycles": self.recycles,
+                "resubmits": self.resubmits,
+            }
+
+
+def make_parser_pool():
+    """A ParserProcessPool when PARSER_PROCESSES > 0, else None (parse inline)."""
+    return ParserProcessPool() if PARSER_PROCESSES > 0 else None
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_pipeline.http_client import FetchTooLarge, HTTPFetcher  # noqa: E402
+
+BODY = bytes(range(256)) * 4096  # 1 MB, every offset distinguishable
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    /pdf        honours Range
+    /no-range   ignores Range (always 200 + full body)
+    /flaky      first request drops the connection halfway through the body
+    /unsized    no Content-Length, body ends when the connection closes
+    anything else: 404
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        if self.path == "/pdf":
+            self._send(self._range())
+        elif self.path == "/no-range":
+            self._send(None)
+        elif self.path == "/flaky":
+            if self.server.dropped:
+                self._send(self._range())
+            else:
+                self.server.dropped = True
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(BODY)))
+                self.end_headers()
+                self.wfile.write(BODY[: len(BODY) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+        elif self.path == "/unsized":
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(BODY)
+            self.close_connection = True
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _range(self):
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        if not m:
+            return None
+        start, end = m.groups()
+        if not start:
+            return len(BODY) - int(end), len(BODY) - 1
+        return int(start), min(int(end), len(BODY) - 1) if end else len(BODY) - 1
+
+    def _send(self, byte_range):
+        if byte_range is None:
+            self.send_response(200)
+            data = BODY
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+            data = BODY[start : end + 1]
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The size guard hangs up mid-body on purpose
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = _Server(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    httpd.dropped = False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+@pytest.fixture
+def fetcher():
+    return HTTPFetcher(pool_size=2, retries=2, backoff=0, timeout=(2, 5))
+
+
+def test_download_writes_whole_body(server, fetcher, tmp_path):
+    dest = tmp_path / "a.pdf"
+    assert fetcher.download(_url(server, "/pdf"), dest) == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert fetcher.stats()["bytesDownloaded"] == len(BODY)
+    assert fetcher.stats()["latency"]["download"]["count"] == 1
+
+
+def test_download_resumes_with_range_after_dropped_connection(server, fetcher, tmp_path):
+    dest = tmp_path / "a.pdf"
+    assert fetcher.download(_url(server, "/flaky"), dest) == len(BODY)
+    assert dest.read_bytes() == BODY
+    first, second = server.requests
+    assert first == ("/flaky", None)
+    assert second[0] == "/flaky"
+    assert re.fullmatch(r"bytes=\d+-", second[1]) and second[1] != "bytes=0-"
+
+
+def test_download_size_guard_uses_content_length(server, fetcher, tmp_path):
+    with pytest.raises(FetchTooLarge):
+        fetcher.download(_url(server, "/pdf"), tmp_path / "a.pdf", max_bytes=len(BODY) - 1)
+    assert fetcher.stats()["errors"] == 1
+
+
+def test_download_size_guard_without_content_length(server, fetcher, tmp_path):
+    with pytest.raises(FetchTooLarge):
+        fetcher.download(_url(server, "/unsized"), tmp_path / "a.pdf", max_bytes=len(BODY) // 2)
+
+
+def test_download_404_raises(server, fetcher, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        fetcher.download(_url(server, "/missing.pdf"), tmp_path / "a.pdf")
+    assert fetcher.stats()["errors"] == 1
+    assert len(server.requests) == 1  # 404 is not retried
+
+
+@pytest.mark.parametrize("path", ["/pdf", "/no-range"])
+def test_head_and_tail_bytes(server, fetcher, path):
+    url = _url(server, path)
+    assert fetcher.fetch_head_bytes(url, 1024) == BODY[:1024]
+    assert fetcher.fetch_tail_bytes(url, 1024) == BODY[-1024:]
+    assert fetcher.fetch_range(url, 100, 199) == BODY[100:200]
+    assert fetcher.stats()["latency"]["range"]["count"] == 3
+
+
+def test_fetch_range_sends_range_header(server, fetcher):
+    fetcher.fetch_head_bytes(_url(server, "/pdf"), 10)
+    fetcher.fetch_tail_bytes(_url(server, "/pdf"), 10)
+    assert [r for _, r in server.requests] == ["bytes=0-9", "bytes=-10"]
+
+
+def test_fetch_range_404_raises(server, fetcher):
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_head_bytes(_url(server, "/missing.pdf"))
+    assert fetcher.stats()["errors"] == 1
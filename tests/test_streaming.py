@@ -0,0 +1,294 @@
+import importlib
+import json
+import os
+import sys
+import threading
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeStreamingModels:
+    """
+    Stand-in for genai's client.models: generate_content_stream yields the
+    given chunks and calls on_chunk(i) before each one, so a test can look at
+    the database while the answer is still being written.
+    """
+
+    def __init__(self, chunks, on_chunk=None):
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+        self.calls = 0
+        self.closed = threading.Event()
+
+    def generate_content_stream(self, model=None, contents=None, **kwargs):
+        self.calls += 1
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for i, text in enumerate(self.chunks):
+                if self.on_chunk:
+                    self.on_chunk(i)
+                yield _Chunk(text)
+        finally:
+            self.closed.set()
+
+
+class _FakeClient:
+    def __init__(self, *args, **kwargs):
+        self.models = None
+
+
+@pytest.fixture(scope="module")
+def appmod(tmp_path_factory):
+    """The app on an in-memory Mongo, with no Gemini or Cloudinary credentials."""
+    import pymongo
+    from google import genai
+
+    cache_dir = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("PDF_CACHE_DIR", str(cache_dir))
+        mp.setenv("INFERENCE_CACHE_MAX_MB", "0")
+        mp.setenv("JWT_SECRET_KEY", "test-secret-" + "x" * 32)
+        mp.setattr(pymongo, "MongoClient", lambda *a, **k: mongomock.MongoClient())
+        mp.setattr(genai, "Client", _FakeClient)
+        sys.modules.pop("app", None)
+        module = importlib.import_module("app")
+    module.app.config["TESTING"] = True
+    return module
+
+
+@pytest.fixture
+def client(appmod):
+    return appmod.app.test_client()
+
+
+def _use_model(appmod, monkeypatch, chunks, on_chunk=None):
+    models = FakeStreamingModels(chunks, on_chunk)
+    monkeypatch.setattr(appmod.gemini_client, "models", models)
+    return models
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _read_until(response, event):
+    """Reads the streamed body until the first `event` event; returns what was read."""
+    body = ""
+    for data in response.response:
+        body += data.decode() if isinstance(data, bytes) else data
+        if f"event: {event}\n" in body:
+            return body
+    raise AssertionError(f"stream ended without a {event} event")
+
+
+def _new_pdf(appmod, page_text, **fields):
+    """A PDF whose page 1 text is already in the shared store, so only Gemini is left."""
+    content_hash = uuid.uuid4().hex
+    appmod.db.parsed_pages.insert_one({"contentHash": content_hash, "pageNumber": 1, "text": page_text})
+    doc = {"contentHash": content_hash, "pageCount": 1, "pages": [], "chatHistory": [], **fields}
+    return appmod.db.pdfs.insert_one(doc).inserted_id
+
+
+def _stored_pages(appmod, pdf_id):
+    return appmod.db.pdfs.find_one({"_id": pdf_id}).get("pages", [])
+
+
+# ======================================================
+# 🔹 /parse-page/stream
+# ======================================================
+def test_parse_page_stream_event_order(appmod, client, monkeypatch):
+    pdf_id = _new_pdf(appmod, f"Photosynthesis {uuid.uuid4().hex}")
+    _use_model(appmod, monkeypatch, ["Plants ", "make ", "food"])
+
+    r = client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1})
+
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    events = _events(r.get_data(as_text=True))
+    assert [name for name, _ in events] == ["page", "delta", "delta", "delta", "done"]
+    assert events[0][1]["text"].startswith("Photosynthesis")
+    assert [data["text"] for name, data in events if name == "delta"] == ["Plants ", "make ", "food"]
+    assert events[-1][1]["explanation"] == "Plants make food"
+
+
+def test_parse_page_stream_saves_only_after_stream_completes(appmod, client, monkeypatch):
+    pdf_id = _new_pdf(appmod, f"Osmosis {uuid.uuid4().hex}")
+    seen = []
+    _use_model(appmod, monkeypatch, ["Water ", "moves"], lambda i: seen.append(_stored_pages(appmod, pdf_id)))
+
+    r = client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1})
+    events = _events(r.get_data(as_text=True))
+
+    assert seen == [[], []]  # nothing stored while chunks were still coming
+    assert events[-1][0] == "done"
+    (page,) = _stored_pages(appmod, pdf_id)
+    assert page["explanation"] == "Water moves"
+
+    # Second request is answered from the stored page without calling the model
+    models = _use_model(appmod, monkeypatch, ["unused"])
+    events = _events(client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1}).get_data(as_text=True))
+    assert [name for name, _ in events] == ["page", "done"]
+    assert events[0][1]["status"] == "already_parsed"
+    assert models.calls == 0
+
+
+def test_parse_page_stream_disconnect_saves_nothing(appmod, client, monkeypatch):
+    pdf_id = _new_pdf(appmod, f"Diffusion {uuid.uuid4().hex}")
+    models = _use_model(appmod, monkeypatch, ["Particles ", "spread ", "out"])
+
+    r = client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1}, buffered=False)
+    _read_until(r, "delta")
+    r.close()  # client went away
+
+    assert models.closed.is_set()
+    assert _stored_pages(appmod, pdf_id) == []
+    shared = appmod.db.parsed_pages.find_one({"contentHash": appmod.db.pdfs.find_one({"_id": pdf_id})["contentHash"]})
+    assert "explanations" not in shared
+    # The page's single-flight key was released, so the next request streams again
+    assert appmod.page_flight.stats()["inFlight"] == 0
+    events = _events(client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1}).get_data(as_text=True))
+    assert events[-1] == ("done", {"status": "newly_parsed", "pageNumber": 1, "explanation": "Particles spread out"})
+
+
+def test_parse_page_stream_failed_reload_releases_the_page(appmod, client, monkeypatch):
+    pdf_id = _new_pdf(appmod, f"Respiration {uuid.uuid4().hex}")
+    models = _use_model(appmod, monkeypatch, ["unused"])
+
+    def fail(*args):
+        raise RuntimeError("mongo is down")
+
+    monkeypatch.setattr(appmod, "_reload_for_page", fail)
+    events = _events(client.post("/parse-page/stream", json={"pdf_id": str(pdf_id), "page_no": 1}).get_data(as_text=True))
+
+    assert events == [("error", {"error": "mongo is down"})]
+    assert models.calls == 0
+    assert appmod.page_flight.stats()["inFlight"] == 0
+    assert appmod.db.page_leases.find_one({"_id": f"{pdf_id}:1"}) is None
+
+
+# ======================================================
+# 🔹 /ask-doubt/stream
+# ======================================================
+def _pdf_with_parsed_page(appmod, **fields):
+    page = {"pageNumber": 1, "text": "Mitochondria make ATP", "explanation": "...", "language": "english"}
+    return appmod.db.pdfs.insert_one({"pages": [page], "chatHistory": [], **fields}).inserted_id
+
+
+def test_ask_doubt_stream_event_order_and_save(appmod, client, monkeypatch):
+    pdf_id = _pdf_with_parsed_page(appmod)
+    seen = []
+    _use_model(
+        appmod, monkeypatch, ["It is ", "the powerhouse"],
+        lambda i: seen.append(appmod.db.pdfs.find_one({"_id": pdf_id})["chatHistory"]),
+    )
+
+    r = client.post("/ask-doubt/stream", json={"pdf_id": str(pdf_id), "page_no": 1, "query": "What is it?"})
+    events = _events(r.get_data(as_text=True))
+
+    assert [name for name, _ in events] == ["delta", "delta", "done"]
+    assert events[-1][1] == {"answer": "It is the powerhouse"}
+    assert seen == [[], []]
+    history = appmod.db.pdfs.find_one({"_id": pdf_id})["chatHistory"]
+    assert [(m["role"], m["parts"][0]["text"]) for m in history] == [
+        ("user", "What is it?"),
+        ("model", "It is the powerhouse"),
+    ]
+
+
+def test_ask_doubt_stream_disconnect_saves_nothing(appmod, client, monkeypatch):
+    pdf_id = _pdf_with_parsed_page(appmod)
+    models = _use_model(appmod, monkeypatch, ["It ", "is ", "the powerhouse"])
+
+    r = client.post("/ask-doubt/stream", json={"pdf_id": str(pdf_id), "page_no": 1, "query": "What?"}, buffered=False)
+    _read_until(r, "delta")
+    r.close()
+
+    assert models.closed.is_set()
+    assert appmod.db.pdfs.find_one({"_id": pdf_id})["chatHistory"] == []
+
+
+def test_ask_doubt_stream_model_error_is_an_error_event(appmod, client, monkeypatch):
+    pdf_id = _pdf_with_parsed_page(appmod)
+
+    def fail(i):
+        if i == 1:
+            raise RuntimeError("quota exceeded")
+
+    _use_model(appmod, monkeypatch, ["It ", "is"], fail)
+    events = _events(client.post(
+        "/ask-doubt/stream", json={"pdf_id": str(pdf_id), "page_no": 1, "query": "What?"}
+    ).get_data(as_text=True))
+
+    assert events == [("delta", {"text": "It "}), ("error", {"error": "quota exceeded"})]
+    assert appmod.db.pdfs.find_one({"_id": pdf_id})["chatHistory"] == []
+
+
+# ======================================================
+# 🔹 /api/conversations/<id>/messages/stream
+# ======================================================
+def _conversation(appmod):
+    from flask_jwt_extended import create_access_token
+
+    user_id = uuid.uuid4().hex
+    pdf_id = _pdf_with_parsed_page(appmod, ownerUserId=user_id)
+    conv_id = appmod.db.conversations.insert_one({"userId": user_id, "pdfId": pdf_id, "messages": []}).inserted_id
+    with appmod.app.app_context():
+        token = create_access_token(identity=user_id)
+    return conv_id, {"Authorization": f"Bearer {token}"}
+
+
+def test_conversation_stream_event_order_and_save(appmod, client, monkeypatch):
+    conv_id, headers = _conversation(appmod)
+    seen = []
+    _use_model(
+        appmod, monkeypatch, ["ATP ", "is energy"],
+        lambda i: seen.append(appmod.db.conversations.find_one({"_id": conv_id})["messages"]),
+    )
+
+    r = client.post(
+        f"/api/conversations/{conv_id}/messages/stream",
+        json={"query": "What is ATP?", "page_no": 1},
+        headers=headers,
+    )
+    events = _events(r.get_data(as_text=True))
+
+    assert [name for name, _ in events] == ["delta", "delta", "done"]
+    assert events[-1][1] == {"answer": "ATP is energy"}
+    assert seen == [[], []]
+    conv = appmod.db.conversations.find_one({"_id": conv_id})
+    assert [(m["role"], m["text"]) for m in conv["messages"]] == [("user", "What is ATP?"), ("model", "ATP is energy")]
+    assert conv["lastPageNo"] == 1
+
+
+def test_conversation_stream_disconnect_saves_nothing(appmod, client, monkeypatch):
+    conv_id, headers = _conversation(appmod)
+    models = _use_model(appmod, monkeypatch, ["ATP ", "is ", "energy"])
+
+    r = client.post(
+        f"/api/conversations/{conv_id}/messages/stream",
+        json={"query": "What is ATP?", "page_no": 1},
+        headers=headers,
+        buffered=False,
+    )
+    _read_until(r, "delta")
+    r.close()
+
+    assert models.closed.is_set()
+    assert appmod.db.conversations.find_one({"_id": conv_id})["messages"] == []